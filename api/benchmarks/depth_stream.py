@@ -0,0 +1,117 @@
+"""Replays synthetic depth frames through the former and the current ingest paths.
+
+``dict`` is the original plain-dict book, ``bisect`` the eagerly sorted book with per-size
+bucket totals, both decoded with the standard json module. ``current`` is the path used by
+OrderBook.process with the decoder from ``src.apps.base``. It costs about as much as ``dict``:
+orjson pays for the bucket totals, it does not make the ingest faster.
+
+Run from the ``api`` directory: ``python -m benchmarks.depth_stream``.
+"""
+import json
+import random
+import time
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from src.apps.base import loads
+from src.apps.order_book import OrderBook
+from src.apps.price_levels import BLOCK_SIZES, PriceLevels, round_down
+
+FRAMES = 20_000
+LEVELS_PER_SIDE = 40
+PRICE = 40_000.0
+
+
+def make_frames(count):
+    random.seed(1)
+    frames = []
+    update_id = 1000
+    for _ in range(count):
+        first_id = update_id + 1
+        update_id += random.randint(5, 50)
+        data = {
+            'e': 'depthUpdate',
+            'E': 0,
+            'T': 0,
+            's': 'BTCUSDT',
+            'U': first_id,
+            'u': update_id,
+            'pu': first_id - 1,
+            'b': [
+                [f'{PRICE - random.randint(1, 20_000) / 10:.1f}', f'{random.choice((0, random.uniform(0, 20))):.3f}']
+                for _ in range(LEVELS_PER_SIDE)
+            ],
+            'a': [
+                [f'{PRICE + random.randint(1, 20_000) / 10:.1f}', f'{random.choice((0, random.uniform(0, 20))):.3f}']
+                for _ in range(LEVELS_PER_SIDE)
+            ],
+        }
+        frames.append(json.dumps({'stream': 'btcusdt@depth', 'data': data}))
+    return frames
+
+
+def convert_items(items):
+    return [list(map(float, item)) for item in items]
+
+
+def dict_ingest(frames):
+    bids, asks = {}, {}
+    for frame in frames:
+        data = json.loads(frame)['data']
+        for to_update, items in ((bids, convert_items(data['b'])), (asks, convert_items(data['a']))):
+            for item in items:
+                if item[1]:
+                    to_update[item[0]] = item[1]
+                else:
+                    to_update.pop(item[0], None)
+
+
+def bisect_ingest(frames):
+    sides = [([], {}, {size: defaultdict(float) for size in BLOCK_SIZES}) for _ in range(2)]
+    for frame in frames:
+        data = json.loads(frame)['data']
+        for (prices, quantities, buckets), items in zip(sides, (convert_items(data['b']), convert_items(data['a']))):
+            for price, quantity in items:
+                previous = quantities.get(price, 0.0)
+                if quantity:
+                    quantities[price] = quantity
+                    if not previous:
+                        insort(prices, price)
+                elif previous:
+                    del quantities[price]
+                    del prices[bisect_left(prices, price)]
+                else:
+                    continue
+                for size, size_buckets in buckets.items():
+                    size_buckets[round_down(price, size)] += quantity - previous
+
+
+def current_ingest(frames):
+    book = OrderBook('BTCUSDT')
+    book.bids, book.asks = PriceLevels(), PriceLevels()
+    book.last_update_id = loads(frames[0])['data']['pu']
+    book.resyncing = False
+    for frame in frames:
+        response = loads(frame)
+        symbol, stream_type = response['stream'].split('@', 1)
+        book.process(stream_type, response['data'])
+    assert book.resync_count == 0
+
+
+def measure(name, ingest, frames):
+    wall, cpu = time.perf_counter(), time.process_time()
+    ingest(frames)
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    print(f'{name:>7}: {len(frames) / wall:10,.0f} frames/s, {cpu / len(frames) * 10 ** 6:6.1f} us CPU per frame')
+
+
+def main():
+    frames = make_frames(FRAMES)
+    print(f'{FRAMES} frames with {LEVELS_PER_SIDE} levels per side, decoder: {loads.__module__}')
+    measure('dict', dict_ingest, frames)
+    measure('bisect', bisect_ingest, frames)
+    measure('current', current_ingest, frames)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+"""Compares the matplotlib and the Pillow order book renderers.
+
+Run from the ``api`` directory: ``python -m benchmarks.ladder``.
+Both images are written to /tmp so they can be compared side by side.
+"""
+from functools import partial
+from timeit import repeat
+
+from src.apps.order_book import BAR_SCALES, render_ladder
+from src.apps.raster import render_ladder_raster
+
+SIZE = 100
+PRICE = '40,050'
+NUMBER = 20
+
+
+def make_ladder():
+    asks = [(str(40_000 + index * SIZE), index * 37 % 450) for index in range(11)]
+    bids = [(str(40_000 - index * SIZE), index * 53 % 520) for index in range(11)]
+    return asks, bids
+
+
+def main():
+    asks, bids = make_ladder()
+    max_size = BAR_SCALES[SIZE]
+    for name, func in (('matplotlib', render_ladder), ('pillow', render_ladder_raster)):
+        with open(f'/tmp/ladder_{name}.png', 'wb') as f:
+            f.write(func(asks, bids, PRICE, max_size))
+        timings = repeat(partial(func, asks, bids, PRICE, max_size), number=NUMBER, repeat=5)
+        print(f'{name:>10}: {min(timings) / NUMBER * 1000:8.2f} ms per image')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Compares the bucketed book with the former dict book: the ladder read and the cost of a diff.
+
+Diffs are string pairs like the depth stream sends, alternating between two so no update is a no-op.
+
+Run from the ``api`` directory: ``python -m benchmarks.order_book``.
+"""
+import random
+from functools import partial
+from itertools import groupby
+from timeit import repeat
+
+from src.apps.price_levels import PriceLevels, round_down
+
+LEVELS = 1000
+PRICE = 40_000.0
+SIZE = 100
+NUMBER = 200
+
+
+def round_down_item(item, size):
+    return round_down(item[0], size)
+
+
+def legacy_ladder(asks, bids, current_price, size):
+    asks = dict(sorted(asks.items()))
+    bids = dict(sorted(bids.items()))
+
+    asks = [list(group) for _, group in groupby(asks.items(), key=partial(round_down_item, size=size))]
+    bids = [list(group) for _, group in groupby(bids.items(), key=partial(round_down_item, size=size))]
+
+    asks = dict(sorted((round_down_item(group[0], size), group) for group in asks))
+    bids = dict(reversed([(round_down_item(group[0], size), group) for group in bids]))
+
+    asks = {price: round(sum(order[1] for order in orders)) for price, orders in asks.items()}
+    bids = {price: round(sum(order[1] for order in orders)) for price, orders in bids.items()}
+
+    price = round_down(current_price, size)
+    return (
+        [(price + i * size, asks.get(price + i * size, 0)) for i in range(11)],
+        [(price - i * size, bids.get(price - i * size, 0)) for i in range(11)],
+    )
+
+
+def legacy_update(levels, items):
+    for price, quantity in items:
+        price, quantity = float(price), float(quantity)
+        if quantity:
+            levels[price] = quantity
+        else:
+            levels.pop(price, None)
+
+
+def apply_diffs(apply, diffs):
+    for diff in diffs:
+        apply(diff)
+
+
+def make_levels(count):
+    random.seed(1)
+    asks = {round(PRICE + random.uniform(0.1, 2000), 1): random.uniform(0.001, 20) for _ in range(count // 2)}
+    bids = {round(PRICE - random.uniform(0.1, 2000), 1): random.uniform(0.001, 20) for _ in range(count // 2)}
+    return asks, bids
+
+
+def best(timings, count=1):
+    return min(timings) / NUMBER / count * 10 ** 6
+
+
+def main():
+    asks, bids = make_levels(LEVELS)
+    ask_levels, bid_levels = PriceLevels(), PriceLevels()
+    ask_levels.apply(asks.items())
+    bid_levels.apply(bids.items())
+
+    def bucketed_ladder():
+        price = round_down(PRICE, SIZE)
+        return ask_levels.get_totals(SIZE, price, 11, SIZE), bid_levels.get_totals(SIZE, price, 11, -SIZE)
+
+    assert bucketed_ladder() == legacy_ladder(asks, bids, PRICE, SIZE)
+
+    legacy = best(repeat(partial(legacy_ladder, asks, bids, PRICE, SIZE), number=NUMBER, repeat=5))
+    bucketed = best(repeat(bucketed_ladder, number=NUMBER, repeat=5))
+    print(f'Ladder of a {LEVELS}-level book, size {SIZE}')
+    print(f'  sort + groupby: {legacy:10.1f} us')
+    print(f'  bucketed:       {bucketed:10.1f} us ({legacy / bucketed:.0f}x)')
+
+    diffs = [[(str(price), f'{random.uniform(0, 20):.3f}') for price in list(asks)[:100]] for _ in range(2)]
+    dict_apply = partial(apply_diffs, partial(legacy_update, dict(asks)), diffs)
+    dict_update = best(repeat(dict_apply, number=NUMBER, repeat=5), len(diffs))
+    levels_update = best(repeat(partial(apply_diffs, ask_levels.apply, diffs), number=NUMBER, repeat=5), len(diffs))
+    print('Applying a 100-level diff')
+    print(f'  dict:           {dict_update:10.1f} us')
+    print(f'  bucketed:       {levels_update:10.1f} us')
+
+
+if __name__ == '__main__':
+    main()
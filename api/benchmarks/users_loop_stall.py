@@ -0,0 +1,104 @@
+"""Measures how long DynamoDB calls stall the event loop while commands are being handled.
+
+A stand-in table answers every request after a blocking sleep of a DynamoDB-like latency. A
+burst of ``save_user`` style commands (read the user, write it back) runs once with the calls
+made directly on the loop, as the repository used to do, and once through the awaitable
+``Users``. A ticker meanwhile measures how late the loop wakes up, which is what the order book
+and whale streams feel.
+
+Run from the ``api`` directory: ``python -m benchmarks.users_loop_stall``.
+"""
+import asyncio
+import random
+import time
+
+from src.users import Users
+
+LATENCY = 0.015
+COMMANDS = 200
+CONCURRENCY = 20
+TICK = 0.001
+
+
+class StandInTable:
+    def __init__(self) -> None:
+        self.items = {}
+
+    def _respond(self) -> None:
+        time.sleep(random.uniform(0.5, 1.5) * LATENCY)
+
+    def query(self, KeyConditionExpression):
+        self._respond()
+        user_id = KeyConditionExpression.get_expression()['values'][1]
+        return {'Items': [dict(self.items[user_id])] if user_id in self.items else []}
+
+    def put_item(self, Item):
+        self._respond()
+        self.items[Item['id']] = dict(Item)
+
+
+class StandInResource:
+    table = StandInTable()
+
+    def Table(self, name):
+        return self.table
+
+
+class StandInUsers(Users):
+    def _create_resource(self):
+        return StandInResource()
+
+
+async def blocking_command(users: Users, user_id: int) -> None:
+    user = users._query_user(user_id) or {'id': user_id}
+    await asyncio.sleep(0)
+    users._put({**user, 'last_seen': time.time()})
+
+
+async def awaitable_command(users: Users, user_id: int) -> None:
+    user = await users.get_user(user_id) or {'id': user_id}
+    await asyncio.sleep(0)
+    await users.put_user(**{**user, 'last_seen': time.time()})
+
+
+async def ticker(stalls: list) -> None:
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(TICK)
+        stalls.append(time.perf_counter() - started - TICK)
+
+
+async def run(name: str, command) -> None:
+    users = StandInUsers()
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def handle(user_id: int) -> None:
+        async with semaphore:
+            await command(users, user_id)
+
+    stalls = []
+    task = asyncio.ensure_future(ticker(stalls))
+    await asyncio.sleep(0.05)
+    stalls.clear()
+    started = time.perf_counter()
+    await asyncio.gather(*(handle(user_id) for user_id in range(COMMANDS)))
+    wall = time.perf_counter() - started
+    await asyncio.sleep(TICK * 10)
+    task.cancel()
+
+    stalls.sort()
+    print(
+        f'{name:>10}: {COMMANDS / wall:6.0f} commands/s, loop stalled {sum(stalls):5.2f} s of {wall:5.2f} s, '
+        f'p50 {stalls[len(stalls) // 2] * 1000:5.1f} ms, p99 {stalls[int(len(stalls) * 0.99)] * 1000:5.1f} ms, '
+        f'max {stalls[-1] * 1000:5.1f} ms late'
+    )
+
+
+def main():
+    print(f'{COMMANDS} commands, {CONCURRENCY} at a time, {LATENCY * 1000:.0f} ms per DynamoDB call')
+    asyncio.run(run('blocking', blocking_command))
+    asyncio.run(run('awaitable', awaitable_command))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Replays a synthetic aggTrade stream at 5,000 trades per second through the whale detector.
+
+The first pass runs the bare detector, the second the full ``WhaleAlerts.process`` handler with
+publishing replaced by a counter. Every few seconds a whale splits a sweep into small trades.
+Subscribers pick random thresholds, so the detector watches every threshold level.
+
+Run from the ``api`` directory: ``python -m benchmarks.whale_clusters``.
+"""
+import random
+import time
+
+from src.apps import whale_alerts
+from src.apps.whale_alerts import WhaleAlerts
+from src.apps.whale_clusters import ClusterDetector
+from src.apps.whale_thresholds import THRESHOLD_OPTIONS, threshold_index
+from src.config import WhaleConfig
+
+RATE = 5_000
+SECONDS = 120
+SWEEP_EVERY = 15
+SUBSCRIBERS = 20_000
+
+
+def make_trades():
+    random.seed(1)
+    trades = []
+    start = 1_600_000_000_000
+    for index in range(RATE * SECONDS):
+        timestamp = start + index * 1000 // RATE
+        symbol = random.choice(('BTCUSDT', 'ETHUSDT'))
+        quantity = random.expovariate(1 / (0.05 if symbol == 'BTCUSDT' else 0.8))
+        if (timestamp - start) % (SWEEP_EVERY * 1000) < 1000 and symbol == 'BTCUSDT':
+            quantity = random.uniform(0.3, 0.6)
+        trades.append({
+            'e': 'aggTrade',
+            'E': timestamp,
+            's': symbol,
+            'p': f'{40_000 if symbol == "BTCUSDT" else 3_000:.2f}',
+            'q': f'{quantity:.3f}',
+            'T': timestamp,
+            'm': random.random() < 0.5,
+        })
+    return trades
+
+
+def make_subscribers():
+    random.seed(2)
+    for user_id in range(SUBSCRIBERS):
+        threshold_index.update_user({
+            'id': user_id,
+            'subscribe': True,
+            'thresholds': {symbol: random.choice(options) for symbol, options in THRESHOLD_OPTIONS.items()},
+        })
+
+
+def measure(name, process, trades):
+    wall, cpu = time.perf_counter(), time.process_time()
+    alerts = sum(process(trade) for trade in trades)
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    print(
+        f'{name:>8}: {len(trades) / wall:10,.0f} trades/s, {cpu / len(trades) * 10 ** 6:5.2f} us CPU per trade, '
+        f'{cpu / SECONDS * 100:4.1f}% of a core at {RATE:,} trades/s, {alerts} alerts'
+    )
+
+
+def main():
+    trades = make_trades()
+    make_subscribers()
+    config = WhaleConfig()
+    print(
+        f'{len(trades):,} trades over {SECONDS} s, {SUBSCRIBERS:,} subscribers, '
+        f'windows {config.windows}, cooldown {config.cooldown:g} s'
+    )
+
+    detector = ClusterDetector(threshold_index.levels, config.window_list, config.cooldown)
+    measure(
+        'detector',
+        lambda trade: len(detector.add(trade['s'], trade['T'], float(trade['q']), float(trade['p']), trade['m'])),
+        trades
+    )
+
+    recipients = []
+    whale_alerts.broadcaster.publish = lambda message, **kwargs: recipients.append(len(kwargs['recipients']))
+    alerts = WhaleAlerts()
+
+    def handle(trade):
+        published = len(recipients)
+        alerts.process('', trade)
+        return len(recipients) - published
+
+    measure('handler', handle, trades)
+    print(f'{sum(recipients):,} recipients in total')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,32 @@
 from aiogram.utils import executor
 
 from .apps import WhaleAlerts
-from .apps.order_book import start_order_book
+from .apps.base import stream_manager
+from .apps.order_book import manager, start_order_book
+from .apps.render import render_pool
+from .broadcast import broadcaster
 from .handlers import dp
+from .user_stats import user_stats
+from .users import users_repo
+
+
+async def on_shutdown(_) -> None:
+    await manager.save_snapshots()
+    await users_repo.flush_pending()
 
 
 def main() -> None:
+    render_pool.start()
+    dp.loop.create_task(stream_manager.run())
+    dp.loop.create_task(broadcaster.run())
     dp.loop.create_task(start_order_book())
+    dp.loop.create_task(manager.render_images())
+    dp.loop.create_task(manager.snapshot_books())
+    dp.loop.create_task(manager.sample_history())
+    dp.loop.create_task(users_repo.save_pending())
+    dp.loop.create_task(user_stats.reconcile_daily())
     dp.loop.create_task(WhaleAlerts().monitor_whale_trades())
-    executor.start_polling(dp)
+    executor.start_polling(dp, on_shutdown=on_shutdown)
 
 
 if __name__ == '__main__':
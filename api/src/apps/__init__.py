@@ -1,2 +1,2 @@
-from .order_book import OrderBook
+from .order_book import OrderBook, OrderBookManager
 from .whale_alerts import WhaleAlerts
@@ -1,35 +1,317 @@
+import asyncio
 import json
 import logging
+import random
+import time
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
 
 import websockets
-from websockets.exceptions import ConnectionClosedError
+from websockets.exceptions import ConnectionClosed, WebSocketException
 
+from src.config import QueuePolicy, StreamConfig
+from .latency import get_histogram
 
-class WebSocketConnector:
-    def __init__(self, connection_url: str, connection_data: dict) -> None:
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
+
+base_url = 'wss://fstream.binance.com/stream'
+
+StreamHandler = Callable[[str, dict], Union[None, Awaitable[None]]]
+
+
+class FrameQueue:
+    """Bounded queue between the socket reader and the consumers of some streams."""
+
+    def __init__(self, name: str, handler: StreamHandler, policy: QueuePolicy, size: int, workers: int = 1) -> None:
+        self.name = name
+        self.handler = handler
+        self.policy = policy
+        self.queue: asyncio.Queue = asyncio.Queue(size)
+        self.latest: Dict[str, Tuple[float, dict]] = {}
+        self.processed = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.receive_latency = get_histogram(f'{name} exchange→receive')
+        self.process_latency = get_histogram(f'{name} receive→processed')
+        self.tasks = [asyncio.ensure_future(self._consume()) for _ in range(workers)]
+
+    async def put(self, stream: str, data: dict) -> None:
+        received_at = time.monotonic()
+        if event_time := data.get('E'):
+            self.receive_latency.record(time.time() * 1000 - event_time)
+        if self.policy == QueuePolicy.coalesce:
+            if pending := self.latest.get(stream):
+                self.latest[stream] = pending[0], data
+                self.coalesced += 1
+                return
+            self.latest[stream] = received_at, data
+            item = stream
+        else:
+            item = stream, received_at, data
+
+        if self.policy != QueuePolicy.block and self.queue.full():
+            dropped = self.queue.get_nowait()
+            self.dropped += 1
+            if self.policy == QueuePolicy.coalesce:
+                self.latest.pop(dropped, None)
+        await self.queue.put(item)
+
+    async def _consume(self) -> None:
+        while True:
+            item = await self.queue.get()
+            if self.policy == QueuePolicy.coalesce:
+                stream = item
+                received_at, data = self.latest.pop(stream)
+            else:
+                stream, received_at, data = item
+            self.lag = time.monotonic() - received_at
+            self.max_lag = max(self.max_lag, self.lag)
+            try:
+                if asyncio.iscoroutine(result := self.handler(stream, data)):
+                    await result
+            except Exception as e:
+                logging.exception(f'Unable to process {stream} frame: {e!r}')
+            self.process_latency.record_since(received_at)
+            self.processed += 1
+
+    def get_stats(self) -> str:
+        max_lag, self.max_lag = self.max_lag, self.lag
+        return (
+            f'{self.name}: {self.queue.qsize()}/{self.queue.maxsize} queued, '
+            f'lag {self.lag * 1000:.0f} ms (max {max_lag * 1000:.0f} ms), {self.processed} processed, '
+            f'{self.dropped} dropped, {self.coalesced} coalesced'
+        )
+
+
+class StreamConnection:
+    """One websocket to Binance carrying a share of the subscribed streams."""
+
+    def __init__(self, manager: 'StreamManager', number: int) -> None:
+        self.manager = manager
+        self.config = manager.config
+        self.url = manager.url
+        self.name = f'connection {number}'
+        self.streams: Set[str] = set()
         self.connection = None
-        self.connection_url = connection_url
-        self.connection_data = connection_data
+        self.task: Optional[asyncio.Future] = None
+        self.lock = asyncio.Lock()
+        self.sent_at = 0.0
+        self.failures = 0
+        self.reconnects = 0
+        self.rotations = 0
+        self.frames = 0
+        self.connected_at = 0.0
+        self.rotate_at = 0.0
+        self.last_frame_at = 0.0
+        self.rtt: Optional[float] = None
+
+    def start(self) -> None:
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.run())
+
+    async def send(self, method: str, streams: List[str], connection=None) -> None:
+        connection = connection or self.connection
+        if not streams or connection is None:
+            return
+        async with self.lock:
+            await asyncio.sleep(self.sent_at + self.config.request_interval - time.monotonic())
+            self.manager.request_id += 1
+            request = json.dumps({'method': method, 'params': streams, 'id': self.manager.request_id})
+            self.sent_at = time.monotonic()
+            try:
+                await connection.send(request)
+            except ConnectionClosed:
+                pass
+
+    def _backoff(self) -> float:
+        delay = min(self.config.backoff_max, self.config.backoff_base * 2 ** self.failures)
+        self.failures += 1
+        return random.uniform(0, delay)
+
+    async def _connect(self):
+        connection = await asyncio.wait_for(
+            websockets.connect(self.url, ping_interval=None), self.config.connect_timeout
+        )
+        subscribed: Set[str] = set()
+        while (added := self.streams - subscribed) | (removed := subscribed - self.streams):
+            subscribed = set(self.streams)
+            await self.send('SUBSCRIBE', list(added), connection)
+            await self.send('UNSUBSCRIBE', list(removed), connection)
+        self.connected_at = self.last_frame_at = time.monotonic()
+        self.rotate_at = self.connected_at + self.config.connection_lifetime
+        return connection
 
-    async def initialize_connection(self) -> None:
-        self.connection = await websockets.connect(self.connection_url)
+    async def _reconnect(self):
+        while True:
+            try:
+                connection = await self._connect()
+            except (OSError, WebSocketException, asyncio.TimeoutError) as e:
+                delay = self._backoff()
+                logging.warning(f'Unable to open {self.name} to {self.url}: {e!r}. Retrying in {delay:.1f} s')
+                await asyncio.sleep(delay)
+            else:
+                self.failures = 0
+                logging.info(f'Opened {self.name} to {self.url} with {len(self.streams)} streams')
+                return connection
+
+    async def run(self) -> None:
+        connection = await self._reconnect()
+        while True:
+            self.connection = connection
+            if not await self._read(connection):
+                self.connection = None
+                self.reconnects += 1
+                connection = await self._reconnect()
+                continue
+
+            try:
+                connection = await self._connect()
+            except (OSError, WebSocketException, asyncio.TimeoutError) as e:
+                self.rotate_at = time.monotonic() + self._backoff()
+                logging.warning(f'Unable to rotate {self.name} to {self.url}: {e!r}')
+                continue
+            self.failures = 0
+            self.rotations += 1
+            asyncio.ensure_future(self.connection.close())
+            self.connection = connection
+            logging.info(f'{self.name.capitalize()} to {self.url} rotated')
+
+    async def _read(self, connection) -> bool:
+        heartbeat = asyncio.ensure_future(self._heartbeat(connection))
+        logged_at = time.monotonic()
+        try:
+            while (timeout := self.rotate_at - time.monotonic()) > 0:
+                try:
+                    message = await asyncio.wait_for(connection.recv(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                except ConnectionClosed as e:
+                    logging.warning(f'{self.name.capitalize()} to {self.url} was closed: {e!r}. Reconnecting')
+                    return False
+                except Exception as e:
+                    delay = self._backoff()
+                    logging.exception(f'Unable to read {self.name} to {self.url}: {e!r}. Reconnecting in {delay:.1f} s')
+                    asyncio.ensure_future(connection.close())
+                    await asyncio.sleep(delay)
+                    return False
+                await self._dispatch(message)
+                if self.last_frame_at - logged_at > 3600:
+                    logged_at = self.last_frame_at
+                    logging.info(f'Streams work norminal. {self.get_stats()}')
+            return True
+        finally:
+            heartbeat.cancel()
 
-    async def subscribe(self) -> None:
-        await self.connection.send(json.dumps(self.connection_data))
-        await self.connection.recv()
+    async def _dispatch(self, message) -> None:
+        self.frames += 1
+        self.last_frame_at = time.monotonic()
+        try:
+            response = loads(message)
+            if (stream := response.get('stream')) is None:
+                if 'error' in response:
+                    logging.warning(f'Stream request {response.get("id")} failed: {response["error"]}')
+                return
+            if queue := self.manager.routes.get(stream):
+                await queue.put(stream, response['data'])
+        except Exception as e:
+            logging.exception(f'Unable to dispatch a frame on {self.name}: {e!r}')
 
-    async def receive_data(self):
-        is_error = False
+    async def _heartbeat(self, connection) -> None:
         while True:
+            await asyncio.sleep(self.config.ping_interval)
+            started = time.monotonic()
             try:
-                data = await self.connection.recv()
-                if is_error:
-                    logging.info(f'{self.__class__.__name__} websocket connection stabilized')
-                return data
-            except ConnectionClosedError as e:
-                is_error = True
-                logging.warning(
-                    f'Websocket connection for {self.__class__.__name__} was closed. Trying to reconnect...'
-                )
-                await self.initialize_connection()
-                await self.subscribe()
+                await asyncio.wait_for(await connection.ping(), self.config.ping_timeout)
+            except asyncio.TimeoutError:
+                logging.warning(f'No pong on {self.name} in {self.config.ping_timeout} s')
+                await connection.close()
+                return
+            except ConnectionClosed:
+                return
+            self.rtt = time.monotonic() - started
+            if self.streams and time.monotonic() - self.last_frame_at > self.config.stale_timeout:
+                logging.warning(f'No frames on {self.name} for {self.config.stale_timeout} s')
+                await connection.close()
+                return
+
+    def get_stats(self) -> str:
+        now = time.monotonic()
+        connected = f'connected for {(now - self.connected_at) / 3600:.1f} h' if self.connection else 'disconnected'
+        rtt = f'{self.rtt * 1000:.0f} ms' if self.rtt is not None else '-'
+        return (
+            f'{self.name}: {connected}, {len(self.streams)} streams, RTT {rtt}, '
+            f'last frame {now - self.last_frame_at:.1f} s ago, {self.frames} frames, '
+            f'{self.reconnects} reconnects, {self.rotations} rotations'
+        )
+
+
+class StreamManager:
+    """Binance streams shared by every consumer."""
+
+    def __init__(self, url: str = base_url) -> None:
+        self.url = url
+        self.config = StreamConfig()
+        self.queues: Dict[str, FrameQueue] = {}
+        self.routes: Dict[str, FrameQueue] = {}
+        self.connections: List[StreamConnection] = []
+        self.assigned: Dict[str, StreamConnection] = {}
+        self.request_id = 0
+        self.running = False
+
+    def add_queue(self, name: str, handler: StreamHandler, policy: QueuePolicy, workers: int = 1) -> FrameQueue:
+        if (queue := self.queues.get(name)) is None:
+            queue = self.queues[name] = FrameQueue(name, handler, policy, self.config.queue_size, workers)
+        return queue
+
+    def _assign(self, stream: str) -> StreamConnection:
+        for connection in self.connections:
+            if len(connection.streams) < self.config.connection_streams:
+                break
+        else:
+            connection = StreamConnection(self, len(self.connections) + 1)
+            self.connections.append(connection)
+            if self.running:
+                connection.start()
+        connection.streams.add(stream)
+        self.assigned[stream] = connection
+        return connection
+
+    async def subscribe(self, streams: Iterable[str], queue: str) -> None:
+        added: Dict[StreamConnection, List[str]] = defaultdict(list)
+        for stream in streams:
+            if stream not in self.routes:
+                self.routes[stream] = self.queues[queue]
+                added[self._assign(stream)].append(stream)
+        for connection, streams in added.items():
+            await connection.send('SUBSCRIBE', streams)
+
+    async def unsubscribe(self, streams: Iterable[str]) -> None:
+        removed: Dict[StreamConnection, List[str]] = defaultdict(list)
+        for stream in streams:
+            if self.routes.pop(stream, None):
+                connection = self.assigned.pop(stream)
+                connection.streams.discard(stream)
+                removed[connection].append(stream)
+        for connection, streams in removed.items():
+            await connection.send('UNSUBSCRIBE', streams)
+
+    async def run(self) -> None:
+        self.running = True
+        if not self.connections:
+            self.connections.append(StreamConnection(self, 1))
+        for connection in self.connections:
+            connection.start()
+
+    def get_stats(self) -> str:
+        return '\n'.join(
+            [connection.get_stats() for connection in self.connections]
+            + [queue.get_stats() for queue in self.queues.values()]
+        )
+
+
+stream_manager = StreamManager()
@@ -0,0 +1,71 @@
+import os
+import struct
+import time
+from typing import Dict, NamedTuple, Optional
+
+import numpy as np
+
+from .price_levels import PriceLevels
+
+MAGIC = b'TOB1'
+HEADER = struct.Struct('<4sIdqdII')
+
+
+class BookSnapshot(NamedTuple):
+    scale: int
+    current_price: float
+    last_update_id: int
+    saved_at: float
+    bids: PriceLevels
+    asks: PriceLevels
+
+
+def save_snapshot(
+        path: str,
+        scale: int,
+        current_price: float,
+        last_update_id: int,
+        bids: Dict[int, float],
+        asks: Dict[int, float]
+) -> None:
+    arrays = []
+    for levels in (bids, asks):
+        arrays.append(np.fromiter(levels.keys(), dtype='<i8', count=len(levels)))
+        arrays.append(np.fromiter(levels.values(), dtype='<f8', count=len(levels)))
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f'{path}.tmp', 'wb') as f:
+        f.write(HEADER.pack(MAGIC, scale, current_price, last_update_id, time.time(), len(bids), len(asks)))
+        for array in arrays:
+            f.write(array.tobytes())
+    os.replace(f'{path}.tmp', path)
+
+
+def load_snapshot(path: str) -> Optional[BookSnapshot]:
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(HEADER.size)
+            size = os.fstat(f.fileno()).st_size
+    except FileNotFoundError:
+        return None
+    if len(header) < HEADER.size:
+        return None
+    magic, scale, current_price, last_update_id, saved_at, bids_count, asks_count = HEADER.unpack(header)
+    if magic != MAGIC or size != HEADER.size + (bids_count + asks_count) * 16:
+        return None
+
+    try:
+        data = np.memmap(path, mode='r', offset=HEADER.size)
+    except (OSError, ValueError):
+        return None
+    sides = []
+    offset = 0
+    for count in (bids_count, asks_count):
+        keys = np.frombuffer(data, dtype='<i8', count=count, offset=offset)
+        offset += keys.nbytes
+        quantities = np.frombuffer(data, dtype='<f8', count=count, offset=offset)
+        offset += quantities.nbytes
+        levels = PriceLevels(scale=scale)
+        levels.add_levels(zip(keys.tolist(), quantities.tolist()))
+        sides.append(levels)
+    return BookSnapshot(scale, current_price, last_update_id, saved_at, *sides)
@@ -0,0 +1,106 @@
+import logging
+from datetime import datetime
+from io import BytesIO
+from typing import Tuple
+
+import matplotlib.dates as mdates
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.colors import LinearSegmentedColormap
+
+from .price_levels import PriceLevels
+
+HEATMAP_COLUMNS = 720
+
+HEATMAP_COLORS = LinearSegmentedColormap.from_list(
+    'liquidity', ['#171a1e', '#21342e', '#58be82', '#9e690b', '#dc535e', '#ffffff']
+)
+
+
+class DepthHistory:
+    """Ring buffer of the bucket totals around the price."""
+
+    def __init__(self, size: int, rows: int, base_size: int) -> None:
+        self.size = size
+        self.rows = rows
+        self.base_size = base_size
+        self.times = np.zeros(size, dtype=np.float64)
+        self.prices = np.zeros(size, dtype=np.float64)
+        self.origins = np.zeros(size, dtype=np.int64)
+        self.totals = np.zeros((size, rows), dtype=np.float32)
+        self.index = 0
+        self.count = 0
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in (self.times, self.prices, self.origins, self.totals))
+
+    def sample(self, timestamp: float, price: float, origin: int, bids: PriceLevels, asks: PriceLevels) -> None:
+        index = self.index
+        self.times[index] = timestamp
+        self.prices[index] = price
+        self.origins[index] = origin
+        self.totals[index] = bids.get_row(origin, self.rows)
+        self.totals[index] += asks.get_row(origin, self.rows)
+        self.index = (index + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def window(self, since: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        if self.count < self.size:
+            order = np.arange(self.count)
+        else:
+            order = np.arange(self.index, self.index + self.size) % self.size
+        order = order[self.times[order] >= since]
+        return self.times[order], self.prices[order], self.origins[order], self.totals[order]
+
+
+def render_heatmap(
+        times: np.ndarray,
+        prices: np.ndarray,
+        origins: np.ndarray,
+        totals: np.ndarray,
+        base_size: int,
+        scale: int,
+        title: str
+) -> bytes:
+    logging.info(f'Start drawing heatmap for {len(times)} samples')
+    rows = totals.shape[1]
+    offsets = (origins - origins.min()) // base_size
+    grid = np.zeros((len(times), offsets.max() + rows), dtype=np.float32)
+    grid[np.arange(len(times))[:, None], offsets[:, None] + np.arange(rows)] = totals
+
+    if (step := -(-len(times) // HEATMAP_COLUMNS)) > 1:
+        columns = len(times) // step
+        grid = np.mean(grid[:columns * step].reshape(columns, step, -1), axis=1)
+        times = times[:columns * step:step]
+        prices = prices[:columns * step:step]
+
+    low = origins.min() / scale
+    high = (origins.min() + grid.shape[1] * base_size) / scale
+    dates = mdates.date2num([datetime.fromtimestamp(timestamp) for timestamp in times])
+
+    fig = plt.figure(figsize=(12, 7), dpi=80)
+    ax = fig.subplots()
+    fig.patch.set_facecolor((0.0902, 0.10196, 0.117647))
+    ax.set_facecolor((0.0902, 0.10196, 0.117647))
+    ax.imshow(
+        grid.T,
+        origin='lower',
+        aspect='auto',
+        interpolation='nearest',
+        cmap=HEATMAP_COLORS,
+        vmax=np.percentile(grid, 99) or None,
+        extent=(dates[0], dates[-1], low, high)
+    )
+    ax.plot(dates, prices, color='white', linewidth=1)
+    ax.set_ylim(low, high)
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
+    ax.tick_params(axis='x', colors='white')
+    ax.tick_params(axis='y', colors='white')
+    ax.set_title(title, color='white')
+    plt.subplots_adjust(left=0.08, right=0.98, bottom=0.07, top=0.94)
+
+    buffer = BytesIO()
+    plt.savefig(buffer, format='png')
+    plt.close('all')
+    return buffer.getvalue()
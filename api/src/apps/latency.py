@@ -0,0 +1,54 @@
+import time
+from bisect import bisect_left
+from typing import Dict, List
+
+LATENCY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000)
+
+
+class LatencyHistogram:
+    """Latencies in milliseconds counted into fixed buckets."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.counts: List[int] = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, milliseconds: float) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS, milliseconds)] += 1
+        self.count += 1
+        self.total += milliseconds
+
+    def record_since(self, started: float) -> None:
+        self.record((time.monotonic() - started) * 1000)
+
+    def percentile(self, fraction: float) -> str:
+        threshold = fraction * self.count
+        seen = 0
+        for bucket, count in zip(LATENCY_BUCKETS, self.counts):
+            seen += count
+            if seen >= threshold:
+                return f'≤{bucket}'
+        return f'>{LATENCY_BUCKETS[-1]}'
+
+    def reset(self) -> None:
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def get_stats(self) -> str:
+        if not self.count:
+            return f'{self.name}: no data'
+        return (
+            f'{self.name}: p50 {self.percentile(0.5)} ms, p99 {self.percentile(0.99)} ms, '
+            f'avg {self.total / self.count:.0f} ms, n={self.count}'
+        )
+
+
+histograms: Dict[str, LatencyHistogram] = {}
+
+
+def get_histogram(name: str) -> LatencyHistogram:
+    if (histogram := histograms.get(name)) is None:
+        histogram = histograms[name] = LatencyHistogram(name)
+    return histogram
@@ -1,138 +1,289 @@
 import asyncio
-import json
 import logging
+import os
+import time
+from collections import deque
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timedelta
 from functools import partial
 from io import BytesIO
-from itertools import groupby
-from multiprocessing import connection, Process, Pipe
-from typing import Dict, Iterable, List, Tuple
+from math import floor, log10
+from typing import Deque, Dict, List, Optional, Tuple
 
 import matplotlib.pyplot as plt
-from aiohttp import ClientSession
+from aiohttp import ClientError, ClientSession
 from pytz import timezone
 
-from src.utils import cached
-from .base import WebSocketConnector
+from src.config import OrderBookConfig
+from .base import stream_manager
+from .book_snapshot import load_snapshot, save_snapshot
+from .depth_history import DepthHistory, render_heatmap
+from .price_levels import BLOCK_SIZES, PriceLevels
+from .raster import render_ladder_raster
+from .render import RenderQueueFull, render_pool
 
-base_url = 'wss://fstream.binance.com/stream'
+rest_url = 'https://fapi.binance.com/fapi/v1'
 
+LADDER_ROWS = 11
 
-def convert_items(items) -> List[List[float]]:
-    return [list(map(float, item)) for item in items]
-
-
-def round_down(value: float, size=100) -> float:
-    value = int(value)
-    return value - value % size
+BAR_SCALES = {
+    100: 500,
+    500: 1000,
+    1000: 2000
+}
 
 
-def round_down_item(item, size) -> float:
-    return round_down(item[0], size)
+def price_scale(price: float) -> int:
+    return 10 ** max(0, 4 - floor(log10(price)))
 
 
-def prepare_group(group, size) -> Tuple[float, List[Tuple[float, float]]]:
-    return round_down_item(group[0], size), group
+def normalize_symbol(symbol: str) -> str:
+    symbol = symbol.upper()
+    if not symbol.endswith('USDT') and not symbol.endswith('BUSD'):
+        symbol = f'{symbol}USDT'
+    return symbol
 
 
-connection_data = {
-    'method': 'SUBSCRIBE',
-    'params': [
-        'btcusdt@depth',
-        'btcusdt@ticker'
-    ],
-    'id': 1
-}
+async def symbol_exists(symbol: str) -> bool:
+    async with ClientSession() as session:
+        async with session.get(f'{rest_url}/ticker/price?symbol={symbol}') as r:
+            return 'price' in await r.json()
 
 
-class OrderBook(WebSocketConnector):
-    def __init__(self) -> None:
-        super().__init__(connection_url=base_url, connection_data=connection_data)
-        self.bids = {}
-        self.asks = {}
+class OrderBook:
+    def __init__(self, symbol: str) -> None:
+        self.symbol = symbol
+        self.scale = 1
+        self.bids = PriceLevels()
+        self.asks = PriceLevels()
         self.current_price = None
         self.start_datetime = datetime.now() + timedelta(minutes=5)
-
-    async def initialize(self) -> None:
-        await self.initialize_connection()
-        async with ClientSession() as session:
-            async with session.get('https://fapi.binance.com/fapi/v1/ticker/price?symbol=BTCUSDT') as r:
-                self.current_price = float((await r.json())['price'])
-            async with session.get('https://fapi.binance.com/fapi/v1/depth?symbol=BTCUSDT&limit=1000') as r:
-                data = await r.json()
-        bid = [[float(i) for i in item] for item in data['bids']]
-        ask = [[float(i) for i in item] for item in data['asks']]
-        self.add_new_data(bid=bid, ask=ask)
-
-    def add_new_data(self, **data_items: List[List[float]]) -> None:
-        for data_type, items in data_items.items():
-            to_update = self.bids if data_type == 'bid' else self.asks
-            for item in items:
-                if item[1]:
-                    to_update[item[0]] = item[1]
+        self.config = OrderBookConfig()
+        self.images: Dict[int, Tuple[bytes, float]] = {}
+        self.rendered_ladders: Dict[int, Tuple[List[Tuple[str, int]], List[Tuple[str, int]]]] = {}
+        self.requested_at: Dict[int, float] = {}
+        self.rendering: Dict[int, asyncio.Future] = {}
+        self.last_update_id: Optional[int] = None
+        self.from_snapshot = False
+        self.resyncing = True
+        self.resync_task: Optional[asyncio.Future] = None
+        self.buffer: Deque[dict] = deque(maxlen=self.config.resync_buffer_size)
+        self.resync_count = 0
+        self.resync_seconds = 0.0
+        self.partial = self.config.depth_stream.split('@')[0] != 'depth'
+        self.staged_bids: Dict[str, str] = {}
+        self.staged_asks: Dict[str, str] = {}
+        self.staged_levels: Optional[dict] = None
+        self.flush_at = 0.0
+        self.history: Optional[DepthHistory] = None
+        if self.symbol in self.config.history_symbol_list:
+            self.history = DepthHistory(self.config.history_size, self.config.history_rows, BLOCK_SIZES[0])
+
+    @property
+    def depth_stream(self) -> str:
+        return f'{self.symbol.lower()}@{self.config.depth_stream}'
+
+    @property
+    def ticker_stream(self) -> str:
+        return f'{self.symbol.lower()}@ticker'
+
+    @property
+    def snapshot_path(self) -> str:
+        return os.path.join(self.config.snapshot_dir, f'{self.symbol}.bin')
+
+    async def initialize(self, session: ClientSession) -> None:
+        async with session.get(f'{rest_url}/ticker/price?symbol={self.symbol}') as r:
+            data = await r.json()
+        if 'price' not in data:
+            raise ValueError(f'Unknown symbol {self.symbol}: {data.get("msg")}')
+        self.current_price = float(data['price'])
+        self.scale = price_scale(self.current_price)
+        self.bids = PriceLevels(scale=self.scale)
+        self.asks = PriceLevels(scale=self.scale)
+
+    def restore(self) -> bool:
+        snapshot = load_snapshot(self.snapshot_path)
+        if snapshot is None or snapshot.scale != self.scale:
+            return False
+        if (age := time.time() - snapshot.saved_at) > self.config.snapshot_max_age:
+            return False
+        self.bids, self.asks = snapshot.bids, snapshot.asks
+        self.last_update_id = snapshot.last_update_id
+        self.start_datetime = datetime.now()
+        logging.info(
+            f'{self.symbol} order book restored from a {age:.0f} s old snapshot at update {self.last_update_id}'
+        )
+        return True
+
+    async def save(self) -> None:
+        self.flush()
+        await asyncio.get_running_loop().run_in_executor(None, partial(
+            save_snapshot,
+            self.snapshot_path,
+            self.scale,
+            self.current_price,
+            self.last_update_id,
+            dict(self.bids.quantities),
+            dict(self.asks.quantities)
+        ))
+
+    def process(self, stream_type: str, data: dict) -> None:
+        if stream_type == 'ticker':
+            self.current_price = float(data['c'])
+            return
+
+        if self.partial:
+            self.staged_levels = data
+            if time.monotonic() >= self.flush_at:
+                self.flush()
+        elif self.resyncing:
+            self.buffer.append(data)
+        elif not self._apply_depth(data):
+            logging.warning(
+                f'{self.symbol} order book missed updates between {self.last_update_id} and {data["U"]}. Resyncing'
+            )
+            self.resync_count += 1
+            self.buffer.append(data)
+            self.start_resync()
+
+    def _apply_depth(self, data: dict) -> bool:
+        if data['u'] < self.last_update_id or data['u'] == self.last_update_id and not self.from_snapshot:
+            return True
+        if self.from_snapshot:
+            if data['U'] > self.last_update_id:
+                return False
+            self.from_snapshot = False
+        elif data['pu'] != self.last_update_id:
+            return False
+        self.last_update_id = data['u']
+        if self.config.coalesce_interval:
+            self.staged_bids.update(data['b'])
+            self.staged_asks.update(data['a'])
+            if time.monotonic() >= self.flush_at:
+                self.flush()
+        else:
+            self.bids.apply(data['b'])
+            self.asks.apply(data['a'])
+        return True
+
+    def flush(self) -> None:
+        if self.staged_levels is not None:
+            self._replace_levels(self.staged_levels['b'], self.staged_levels['a'])
+            self.staged_levels = None
+        if self.staged_bids:
+            self.bids.apply(self.staged_bids.items())
+            self.staged_bids.clear()
+        if self.staged_asks:
+            self.asks.apply(self.staged_asks.items())
+            self.staged_asks.clear()
+        self.flush_at = time.monotonic() + self.config.coalesce_interval
+
+    def start_resync(self) -> None:
+        self.resyncing = True
+        if self.resync_task is None:
+            self.resync_task = asyncio.ensure_future(self.resync())
+
+    async def resync(self) -> None:
+        started = time.monotonic()
+        try:
+            while True:
+                try:
+                    async with ClientSession() as session:
+                        async with session.get(f'{rest_url}/depth?symbol={self.symbol}&limit=1000') as r:
+                            snapshot = await r.json()
+                    self._load_snapshot(snapshot)
+                except (ClientError, asyncio.TimeoutError, KeyError) as e:
+                    logging.warning(f'Unable to load {self.symbol} order book snapshot: {e!r}')
                 else:
-                    to_update.pop(item[0], None)
-
-    def get_grouped_orders(
-            self,
-            size: int
-    ) -> Tuple[Dict[float, List[Tuple[float, float]]], Dict[float, List[Tuple[float, float]]]]:
-        asks = dict(sorted(self.asks.items()))
-        bids = dict(sorted(self.bids.items()))
-
-        asks = [list(group) for _, group in groupby(asks.items(), key=partial(round_down_item, size=size))]
-        bids = [list(group) for _, group in groupby(bids.items(), key=partial(round_down_item, size=size))]
-
-        asks = [prepare_group(group, size) for group in asks]
-        bids = [prepare_group(group, size) for group in bids]
-
-        asks = dict(sorted(asks))
-        bids = dict(reversed(bids))
-
-        return asks, bids
-
-    def sum_groups(self, *groups) -> Iterable[Dict[float, float]]:
-        results = []
-        for group in groups:
-            results.append({price: sum([order[1] for order in orders]) for price, orders in group.items()})
-        return results
+                    if self._replay():
+                        break
+                await asyncio.sleep(1)
+        finally:
+            self.resync_task = None
+        self.resyncing = False
+        self.resync_seconds += time.monotonic() - started
+        logging.info(f'{self.symbol} order book synced at update {self.last_update_id}')
+
+    def _replace_levels(self, bid: List[List[str]], ask: List[List[str]]) -> None:
+        bids = PriceLevels(scale=self.scale)
+        asks = PriceLevels(scale=self.scale)
+        bids.apply(bid)
+        asks.apply(ask)
+        self.bids, self.asks = bids, asks
+
+    def _load_snapshot(self, snapshot: dict) -> None:
+        self.staged_bids.clear()
+        self.staged_asks.clear()
+        bids, asks = self.bids, self.asks
+        self._replace_levels(snapshot['bids'], snapshot['asks'])
+        if self.bids and bids:
+            lowest = self.bids.prices[0]
+            self.bids.add_levels((key, quantity) for key, quantity in bids.quantities.items() if key < lowest)
+        if self.asks and asks:
+            highest = self.asks.prices[-1]
+            self.asks.add_levels((key, quantity) for key, quantity in asks.quantities.items() if key > highest)
+        self.last_update_id = snapshot['lastUpdateId']
+        self.from_snapshot = True
+
+    def _replay(self) -> bool:
+        buffer, self.buffer = self.buffer, deque(maxlen=self.buffer.maxlen)
+        return all(self._apply_depth(data) for data in buffer)
+
+    def sample_history(self) -> None:
+        if self.history is None or self.current_price is None or self.resyncing:
+            return
+        self.flush()
+        base_size = self.history.base_size
+        origin = self.bids.bucket(self.current_price, base_size) - self.history.rows // 2 * base_size
+        self.history.sample(time.time(), self.current_price, origin, self.bids, self.asks)
+
+    async def draw_heatmap(self, hours: float):
+        if self.history is None:
+            return f'История стакана {self.symbol} не ведется'
+        times, prices, origins, totals = self.history.window(time.time() - hours * 3600)
+        if len(times) < 2:
+            return 'История стакана еще не накоплена'
+        try:
+            image = await render_pool.render(
+                'heatmap',
+                render_heatmap,
+                times,
+                prices,
+                origins,
+                totals,
+                self.history.base_size,
+                self.scale,
+                f'{self.symbol} {hours:g}h'
+            )
+        except (RenderQueueFull, asyncio.TimeoutError):
+            logging.warning(f'{self.symbol} heatmap was not rendered in time')
+            return 'Стакан временно недоступен, попробуйте позже'
+        except BrokenProcessPool as e:
+            logging.warning(f'{self.symbol} heatmap was not rendered: {e!r}')
+            return 'Стакан временно недоступен, попробуйте позже'
+        return BytesIO(image)
+
+    def get_stats(self) -> str:
+        return (
+            f'{self.symbol}: {len(self.bids)} bids, {len(self.asks)} asks, update {self.last_update_id}, '
+            f'{"resyncing, " if self.resyncing else ""}'
+            f'{self.resync_count} resyncs in {self.resync_seconds:.1f} s'
+        )
 
-    def round_groups(self, *groups) -> Iterable[Dict[float, float]]:
-        return [{k: round(v) for k, v in group.items()} for group in groups]
+    def format_price(self, units: float, grouped=False) -> str:
+        digits = len(str(self.scale)) - 1
+        return f'{units / self.scale:{"," if grouped else ""}.{digits}f}'
+
+    def get_ladder(self, size: int) -> Tuple[List[Tuple[str, int]], List[Tuple[str, int]]]:
+        self.flush()
+        price = self.asks.bucket(self.current_price, size)
+        asks = self.asks.get_totals(size, price, LADDER_ROWS, size)
+        bids = self.bids.get_totals(size, price, LADDER_ROWS, -size)
+        return (
+            [(self.format_price(price), total) for price, total in asks],
+            [(self.format_price(price), total) for price, total in bids],
+        )
 
-    def _draw_asks(self, asks: Dict[float, int], ax, size, max_size) -> None:
-        rows = []
-        cur_price = round_down(self.current_price, size)
-        index = 0
-        while True:
-            count_by_price = asks.get(cur_price, 0)
-            rows.append((cur_price, count_by_price, index))
-            index += 1
-            cur_price += size
-            if index == 11:
-                break
-        ax.barh(y=[i[-1] for i in rows], width=[i[1] for i in rows], height=0.8, color='#362328')
-        for index, item in enumerate(rows):
-            ax.text(25 * max_size / 500, index - .2, str(item[1]), color='white', horizontalalignment='center')
-            ax.text(max_size - 7 * max_size / 500, index - .2, str(item[0]), color='#DC535E')
-
-    def _draw_bids(self, bids: Dict[float, int], ax, size, max_size) -> None:
-        rows = []
-        cur_price = round_down(self.current_price, size)
-        index = -1
-        while True:
-            count_by_price = bids.get(cur_price, 0)
-            rows.append((cur_price, count_by_price, index))
-            index -= 1
-            cur_price -= size
-            if index == -12:
-                break
-        ax.barh(y=[i[-1] for i in rows], width=[i[1] for i in rows], height=0.8, color='#21342e')
-        for index, item in enumerate(rows):
-            ax.text(25 * max_size / 500, -index - 1.2, str(item[1]), color='white', horizontalalignment='center')
-            ax.text(max_size - 7 * max_size / 500, -index - 1.2, str(item[0]), color='#58BE82')
-
-    @cached(only_kwargs=True)
     async def draw(self, size):
         if (now := datetime.now()) < self.start_datetime:
             delta = (self.start_datetime - now)
@@ -140,81 +291,228 @@ class OrderBook(WebSocketConnector):
             minutes_part = f'{minutes} мин ' if minutes else ''
             return f'Стакан будет досупен через {minutes_part}{seconds} сек'
 
-        receive_end, send_end = Pipe(duplex=False)
-        p = Process(target=self._draw, args=(size, send_end))
-        p.start()
-        p.join()
-        buffer = BytesIO()
-        buffer.write(receive_end.recv())
-        buffer.seek(0)
-        return buffer
-
-    def _draw(self, size: int, pipe: connection.Connection) -> None:
-        asks, bids = self.round_groups(*self.sum_groups(*self.get_grouped_orders(size)))
-
-        max_size = {
-            100: 500,
-            500: 1000,
-            1000: 2000
-        }[size]
-
-        fig = plt.figure(figsize=(5, 10))
-        ax = fig.subplots()
-        fig.tight_layout()
-        plt.subplots_adjust(left=0, top=1, right=1, bottom=0)
-
-        ax.set_facecolor((0.0902, 0.10196, 0.117647))
-        ax.set_yticklabels([])
-        ax.set_xticklabels([])
-        ax.set_yticks([])
-        ax.set_xticks([])
-        ax.set_xlim([0, max_size])
-        ax.set_ylim([-12, 11])
-        ax.invert_xaxis()
-        ax.text(
-            max_size - 7 * max_size / 500, -11.87,
-            f'Last updated at {datetime.now(tz=timezone("Europe/Moscow")).time().replace(microsecond=0)} (GMT+3)',
-            color='white'
-        )
-        self._draw_asks(asks, ax, size, max_size)
-        self._draw_bids(bids, ax, size, max_size)
-        plt.axhline(y=-0.5, xmax=0.42, linestyle='-', color='#9e690b')
-        plt.axhline(y=-0.5, xmin=0.58, linestyle='-', color='#9e690b')
-        ax.text(
-            max_size / 2, -0.6,
-            f'{int(self.current_price):,d}',
-            color='#9e690b',
-            horizontalalignment='center'
-        )
-
-        buffer = BytesIO()
-        plt.savefig(buffer, format='png')
-        buffer.seek(0)
+        self.requested_at[size] = time.monotonic()
+        image, rendered_at = self.images.get(size, (None, 0))
+        if rendered_at < time.monotonic() - 2 * self.config.render_interval:
+            image = await self.render(size) or image
+        if image is None:
+            return 'Стакан временно недоступен, попробуйте позже'
+        return BytesIO(image)
+
+    async def render(self, size: int) -> Optional[bytes]:
+        if size not in self.rendering:
+            self.rendering[size] = asyncio.ensure_future(self._render(size))
+        return await asyncio.shield(self.rendering[size])
+
+    async def _render(self, size: int) -> Optional[bytes]:
+        asks, bids = self.get_ladder(size)
+        try:
+            image = await render_pool.render(
+                'orders',
+                LADDER_RENDERERS[self.config.renderer],
+                asks,
+                bids,
+                self.format_price(int(self.current_price * self.scale), grouped=True),
+                BAR_SCALES[size] * self.scale
+            )
+        except (RenderQueueFull, asyncio.TimeoutError):
+            logging.warning(f'{self.symbol} order book image for size {size} was not rendered in time')
+            return None
+        except BrokenProcessPool as e:
+            logging.warning(f'{self.symbol} order book image for size {size} was not rendered: {e!r}')
+            return None
+        finally:
+            self.rendering.pop(size, None)
+        self.images[size] = image, time.monotonic()
+        self.rendered_ladders[size] = asks, bids
+        return image
+
+    def _needs_render(self, size: int) -> bool:
+        now = time.monotonic()
+        if self.requested_at.get(size, 0) < now - self.config.idle_timeout or size in self.rendering:
+            return False
+        if self.images.get(size, (None, 0))[1] < now - self.config.render_interval:
+            return True
+
+        rendered = self.rendered_ladders.get(size)
+        if rendered is None:
+            return True
+        threshold = self.config.change_threshold * BAR_SCALES[size] * self.scale
+        for old_rows, new_rows in zip(rendered, self.get_ladder(size)):
+            for (old_price, old_total), (new_price, new_total) in zip(old_rows, new_rows):
+                if old_price != new_price or abs(old_total - new_total) >= threshold:
+                    return True
+        return False
+
+    async def refresh_images(self) -> None:
+        if self.current_price is None:
+            return
+        for size in BLOCK_SIZES:
+            if self._needs_render(size):
+                await self.render(size)
+
+
+class OrderBookManager:
+    """Keeps the order books of many symbols on the shared Binance stream."""
 
-        plt.close('all')
+    def __init__(self) -> None:
+        self.books: Dict[str, OrderBook] = {}
+        self.adding: Dict[str, asyncio.Future] = {}
+
+    def get(self, symbol: str) -> Optional[OrderBook]:
+        return self.books.get(symbol)
+
+    def process(self, stream: str, data: dict) -> None:
+        symbol, stream_type = stream.split('@', 1)
+        if book := self.books.get(symbol.upper()):
+            book.process(stream_type, data)
+
+    async def add_symbol(self, symbol: str) -> OrderBook:
+        if book := self.books.get(symbol):
+            return book
+        if symbol not in self.adding:
+            self.adding[symbol] = asyncio.ensure_future(self._add_symbol(symbol))
+        return await asyncio.shield(self.adding[symbol])
+
+    async def _add_symbol(self, symbol: str) -> OrderBook:
+        book = OrderBook(symbol)
+        try:
+            async with ClientSession() as session:
+                await book.initialize(session)
+        finally:
+            self.adding.pop(symbol, None)
+        self.books[symbol] = book
+        stream_manager.add_queue('depth', self.process, stream_manager.config.depth_policy)
+        stream_manager.add_queue('ticker', self.process, stream_manager.config.ticker_policy)
+        await stream_manager.subscribe([book.depth_stream], 'depth')
+        await stream_manager.subscribe([book.ticker_stream], 'ticker')
+        if book.partial:
+            book.resyncing = False
+        else:
+            try:
+                book.restore()
+            except Exception as e:
+                logging.warning(f'Unable to restore {symbol} order book snapshot: {e!r}')
+            book.start_resync()
+        logging.info(f'Order book for {symbol} added')
+        return book
+
+    async def remove_symbol(self, symbol: str) -> bool:
+        if (book := self.books.pop(symbol, None)) is None:
+            return False
+
+        if book.resync_task:
+            book.resync_task.cancel()
+
+        await stream_manager.unsubscribe([book.depth_stream, book.ticker_stream])
+        logging.info(f'Order book for {symbol} removed')
+        return True
+
+    async def run(self) -> None:
+        for symbol in OrderBookConfig().symbol_list:
+            try:
+                await self.add_symbol(symbol)
+            except ValueError as e:
+                logging.error(e)
+
+    async def save_snapshots(self) -> None:
+        for book in list(self.books.values()):
+            if book.partial or book.resyncing:
+                continue
+            try:
+                await book.save()
+            except OSError as e:
+                logging.warning(f'Unable to save {book.symbol} order book snapshot: {e!r}')
+
+    async def snapshot_books(self) -> None:
+        while True:
+            await asyncio.sleep(OrderBookConfig().snapshot_interval)
+            await self.save_snapshots()
 
-        pipe.send(buffer.read())
+    async def sample_history(self) -> None:
+        while True:
+            await asyncio.sleep(OrderBookConfig().history_interval)
+            for book in list(self.books.values()):
+                book.sample_history()
 
+    async def render_images(self) -> None:
+        while True:
+            await asyncio.sleep(OrderBookConfig().render_check_interval)
+            for book in list(self.books.values()):
+                try:
+                    await book.refresh_images()
+                except Exception as e:
+                    logging.exception(f'Unable to render {book.symbol} order book images: {e!r}')
+
+
+def _draw_asks(rows: List[Tuple[str, int]], ax, max_size) -> None:
+    ax.barh(y=list(range(len(rows))), width=[i[1] for i in rows], height=0.8, color='#362328')
+    for index, item in enumerate(rows):
+        ax.text(25 * max_size / 500, index - .2, str(item[1]), color='white', horizontalalignment='center')
+        ax.text(max_size - 7 * max_size / 500, index - .2, str(item[0]), color='#DC535E')
+
+
+def _draw_bids(rows: List[Tuple[str, int]], ax, max_size) -> None:
+    ax.barh(y=list(range(-1, -len(rows) - 1, -1)), width=[i[1] for i in rows], height=0.8, color='#21342e')
+    for index, item in enumerate(rows):
+        ax.text(25 * max_size / 500, -index - 1.2, str(item[1]), color='white', horizontalalignment='center')
+        ax.text(max_size - 7 * max_size / 500, -index - 1.2, str(item[0]), color='#58BE82')
+
+
+def render_ladder(
+        asks: List[Tuple[str, int]],
+        bids: List[Tuple[str, int]],
+        price: str,
+        max_size: float
+) -> bytes:
+    fig = plt.figure(figsize=(5, 10))
+    ax = fig.subplots()
+    fig.tight_layout()
+    plt.subplots_adjust(left=0, top=1, right=1, bottom=0)
+
+    ax.set_facecolor((0.0902, 0.10196, 0.117647))
+    ax.set_yticklabels([])
+    ax.set_xticklabels([])
+    ax.set_yticks([])
+    ax.set_xticks([])
+    ax.set_xlim([0, max_size])
+    ax.set_ylim([-12, 11])
+    ax.invert_xaxis()
+    ax.text(
+        max_size - 7 * max_size / 500, -11.87,
+        f'Last updated at {datetime.now(tz=timezone("Europe/Moscow")).time().replace(microsecond=0)} (GMT+3)',
+        color='white'
+    )
+    _draw_asks(asks, ax, max_size)
+    _draw_bids(bids, ax, max_size)
+    plt.axhline(y=-0.5, xmax=0.42, linestyle='-', color='#9e690b')
+    plt.axhline(y=-0.5, xmin=0.58, linestyle='-', color='#9e690b')
+    ax.text(
+        max_size / 2, -0.6,
+        price,
+        color='#9e690b',
+        horizontalalignment='center'
+    )
+
+    buffer = BytesIO()
+    plt.savefig(buffer, format='png')
+
+    plt.close('all')
+
+    return buffer.getvalue()
+
+
+LADDER_RENDERERS = {
+    'matplotlib': render_ladder,
+    'pillow': render_ladder_raster,
+}
 
-book = OrderBook()
+manager = OrderBookManager()
 
 
 async def start_order_book() -> None:
     logging.info('Initializing Order Book')
-    await book.initialize()
-    logging.info('Done')
-    await book.subscribe()
-    start = datetime.now()
-    while True:
-        response = json.loads(await book.receive_data())
-        data = response['data']
-        if '@ticker' in response['stream']:
-            book.current_price = float(data['c'])
-            continue
-        book.add_new_data(bid=convert_items(data['b']), ask=convert_items(data['a']))
-        if (now := datetime.now()) - timedelta(minutes=60) > start:
-            start = now
-            logging.info('Order book works norminal')
+    await manager.run()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,87 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+BLOCK_SIZES = (100, 500, 1000)
+
+TICK_FACTOR = 100
+
+
+def round_down(value: float, size=100) -> int:
+    value = int(value)
+    return value - value % size
+
+
+class PriceLevels:
+    """One side of an order book."""
+
+    def __init__(self, base_size: int = BLOCK_SIZES[0], scale: int = 1) -> None:
+        self.base_size = base_size
+        self.scale = scale
+        self.factor = scale * TICK_FACTOR
+        self.quantities: Dict[int, float] = {}
+        self.buckets: Dict[int, float] = defaultdict(float)
+        self._prices: Optional[List[int]] = None
+
+    def __len__(self) -> int:
+        return len(self.quantities)
+
+    @property
+    def prices(self) -> List[int]:
+        if self._prices is None:
+            self._prices = sorted(self.quantities)
+        return self._prices
+
+    def to_key(self, price: float) -> int:
+        return round(price * self.factor)
+
+    def apply(self, items: Iterable[Tuple[Union[str, float], Union[str, float]]]) -> None:
+        factor = self.factor
+        base_size = self.base_size
+        quantities = self.quantities
+        buckets = self.buckets
+        resized = False
+        for price, quantity in items:
+            key = round(float(price) * factor)
+            quantity = float(quantity)
+            previous = quantities.get(key, 0.0)
+            if quantity:
+                quantities[key] = quantity
+                resized = resized or not previous
+            elif previous:
+                del quantities[key]
+                resized = True
+            else:
+                continue
+
+            units = key // TICK_FACTOR
+            buckets[units - units % base_size] += quantity - previous
+        if resized:
+            self._prices = None
+
+    def add_levels(self, items: Iterable[Tuple[int, float]]) -> None:
+        base_size = self.base_size
+        quantities = self.quantities
+        buckets = self.buckets
+        for key, quantity in items:
+            if not quantity or key in quantities:
+                continue
+            quantities[key] = quantity
+            units = key // TICK_FACTOR
+            buckets[units - units % base_size] += quantity
+        self._prices = None
+
+    def bucket(self, price: float, size: int) -> int:
+        return round_down(self.to_key(price) // TICK_FACTOR, size)
+
+    def get_row(self, start: int, count: int) -> List[float]:
+        buckets = self.buckets
+        return [buckets.get(price, 0.0) for price in range(start, start + count * self.base_size, self.base_size)]
+
+    def get_totals(self, size: int, start: int, count: int, step: int) -> List[Tuple[int, int]]:
+        buckets = self.buckets
+        if size == self.base_size:
+            return [(price, round(buckets.get(price, 0))) for price in range(start, start + count * step, step)]
+        return [
+            (price, round(sum(buckets.get(bucket, 0) for bucket in range(price, price + size, self.base_size))))
+            for price in range(start, start + count * step, step)
+        ]
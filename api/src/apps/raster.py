@@ -0,0 +1,139 @@
+import os
+from datetime import datetime
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+
+import matplotlib
+from PIL import Image, ImageDraw, ImageFont
+from pytz import timezone
+
+WIDTH = 500
+HEIGHT = 1000
+ROW_HEIGHT = HEIGHT / 23
+FONT_SIZE = 14
+
+BACKGROUND = (23, 26, 30)
+FRAME = (0, 0, 0)
+TEXT = (255, 255, 255)
+PRICE_LINE = (158, 105, 11)
+ASKS_BAR = (54, 35, 40)
+ASKS_PRICE = (220, 83, 94)
+BIDS_BAR = (33, 52, 46)
+BIDS_PRICE = (88, 190, 130)
+
+
+def to_y(value: float) -> int:
+    return round((11 - value) * ROW_HEIGHT)
+
+
+def blend(color: Tuple[int, int, int], background: Tuple[int, int, int], alpha: float) -> Tuple[int, ...]:
+    return tuple(round(b + (c - b) * alpha) for c, b in zip(color, background))
+
+
+def build_palette() -> Image.Image:
+    colors = {FRAME: None}
+    for background in (BACKGROUND, ASKS_BAR, BIDS_BAR):
+        for color in (TEXT, PRICE_LINE, ASKS_PRICE, BIDS_PRICE):
+            for level in range(16):
+                colors[blend(color, background, level / 15)] = None
+    palette = Image.new('P', (1, 1))
+    palette.putpalette([channel for color in colors for channel in color])
+    return palette
+
+
+class GlyphCache:
+    def __init__(self, font: ImageFont.FreeTypeFont) -> None:
+        self.font = font
+        self.glyphs: Dict[str, Tuple[Image.Image, int, int, float]] = {}
+
+    def get(self, char: str) -> Tuple[Image.Image, int, int, float]:
+        if (glyph := self.glyphs.get(char)) is None:
+            left, top, right, bottom = self.font.getbbox(char, anchor='ls')
+            mask = Image.new('L', (max(right - left, 1), max(bottom - top, 1)))
+            ImageDraw.Draw(mask).text((-left, -top), char, font=self.font, fill=255, anchor='ls')
+            glyph = self.glyphs[char] = mask, left, top, self.font.getlength(char)
+        return glyph
+
+    def width(self, text: str) -> float:
+        return sum(self.get(char)[3] for char in text)
+
+    def draw(self, image: Image.Image, x: float, baseline: int, text: str, color: Tuple[int, int, int]) -> None:
+        for char in text:
+            mask, left, top, advance = self.get(char)
+            if char != ' ':
+                image.paste(color, (round(x) + left, baseline + top), mask)
+            x += advance
+
+
+class RasterLadder:
+    """Draws the order book ladder with Pillow in the same layout as ``render_ladder``."""
+
+    def __init__(self) -> None:
+        font_path = os.path.join(matplotlib.get_data_path(), 'fonts', 'ttf', 'DejaVuSans.ttf')
+        self.glyphs = GlyphCache(ImageFont.truetype(font_path, FONT_SIZE))
+        self.palette = build_palette()
+        self.template = Image.new('RGB', (WIDTH, HEIGHT), BACKGROUND)
+        draw = ImageDraw.Draw(self.template)
+        draw.rectangle((0, 0, WIDTH - 1, HEIGHT - 1), outline=FRAME)
+        line_top = to_y(-0.5) - 1
+        draw.rectangle((1, line_top, round(0.42 * WIDTH), line_top + 1), fill=PRICE_LINE)
+        draw.rectangle((round(0.58 * WIDTH), line_top, WIDTH - 2, line_top + 1), fill=PRICE_LINE)
+
+    def _draw_rows(
+            self,
+            image: Image.Image,
+            draw: ImageDraw.ImageDraw,
+            rows: List[Tuple[str, int]],
+            positions: List[int],
+            max_size: float,
+            bar_color: Tuple[int, int, int],
+            price_color: Tuple[int, int, int]
+    ) -> None:
+        for position, (price, total) in zip(positions, rows):
+            if (width := round(min(total, max_size) / max_size * WIDTH)) > 0:
+                draw.rectangle(
+                    (WIDTH - width, to_y(position + 0.4), WIDTH - 2, to_y(position - 0.4) - 1),
+                    fill=bar_color
+                )
+            baseline = to_y(position - 0.2)
+            total = str(total)
+            self.glyphs.draw(image, 475 - self.glyphs.width(total) / 2, baseline, total, TEXT)
+            self.glyphs.draw(image, 7, baseline, price, price_color)
+
+    def render(
+            self,
+            asks: List[Tuple[str, int]],
+            bids: List[Tuple[str, int]],
+            price: str,
+            max_size: float
+    ) -> bytes:
+        image = self.template.copy()
+        draw = ImageDraw.Draw(image)
+        self._draw_rows(image, draw, asks, list(range(len(asks))), max_size, ASKS_BAR, ASKS_PRICE)
+        self._draw_rows(image, draw, bids, list(range(-1, -len(bids) - 1, -1)), max_size, BIDS_BAR, BIDS_PRICE)
+
+        self.glyphs.draw(image, WIDTH / 2 - self.glyphs.width(price) / 2, to_y(-0.6), price, PRICE_LINE)
+        self.glyphs.draw(
+            image, 7, to_y(-11.87),
+            f'Last updated at {datetime.now(tz=timezone("Europe/Moscow")).time().replace(microsecond=0)} (GMT+3)',
+            TEXT
+        )
+
+        buffer = BytesIO()
+        image.quantize(palette=self.palette, dither=Image.NONE).save(buffer, format='png', compress_level=1)
+        return buffer.getvalue()
+
+
+raster_ladder: Optional[RasterLadder] = None
+
+
+def render_ladder_raster(
+        asks: List[Tuple[str, int]],
+        bids: List[Tuple[str, int]],
+        price: str,
+        max_size: float
+) -> bytes:
+    global raster_ladder
+    if raster_ladder is None:
+        raster_ladder = RasterLadder()
+    return raster_ladder.render(asks, bids, price, max_size)
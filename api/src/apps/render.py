@@ -0,0 +1,126 @@
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import Callable, Dict, Optional
+
+import matplotlib.pyplot as plt
+
+from src.config import RenderConfig
+
+
+class RenderQueueFull(Exception):
+    pass
+
+
+def warm_up() -> None:
+    fig = plt.figure(figsize=(1, 1))
+    fig.text(0, 0, 'Last updated at 0123456789,:()')
+    fig.savefig(BytesIO(), format='png')
+    plt.close('all')
+
+
+class RenderLane:
+    def __init__(
+            self,
+            name: str,
+            concurrency: int,
+            queue_size: int,
+            timeout: float,
+            shared: Optional[asyncio.Semaphore] = None
+    ) -> None:
+        self.name = name
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.shared = shared
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.waiting = 0
+
+    async def acquire(self) -> None:
+        await self.semaphore.acquire()
+        if self.shared is not None:
+            try:
+                await self.shared.acquire()
+            except BaseException:
+                self.semaphore.release()
+                raise
+
+    def release(self) -> None:
+        if self.shared is not None:
+            self.shared.release()
+        self.semaphore.release()
+
+
+class RenderPool:
+    """Long-lived matplotlib workers shared by every chart."""
+
+    def __init__(self) -> None:
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.workers = 0
+        self.lanes: Dict[str, RenderLane] = {}
+
+    def start(self) -> None:
+        config = RenderConfig()
+        self.workers = config.workers
+        self._start_executor()
+        background = asyncio.Semaphore(max(1, config.workers - 1))
+        self.lanes = {
+            'orders': RenderLane('orders', config.workers, config.queue_size, config.orders_timeout),
+            'funding': RenderLane(
+                'funding',
+                max(1, config.funding_concurrency),
+                config.queue_size,
+                config.funding_timeout,
+                background
+            ),
+            'heatmap': RenderLane(
+                'heatmap',
+                max(1, config.heatmap_concurrency),
+                config.queue_size,
+                config.heatmap_timeout,
+                background
+            ),
+        }
+
+    def _start_executor(self) -> None:
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=warm_up)
+        for _ in range(self.workers):
+            self.executor.submit(int)
+        logging.info(f'Render pool started with {self.workers} workers')
+
+    def _restart_executor(self, executor: ProcessPoolExecutor) -> None:
+        if executor is self.executor:
+            logging.warning('Render pool is broken. Restarting workers')
+            executor.shutdown(wait=False)
+            self._start_executor()
+
+    async def render(self, lane_name: str, func: Callable[..., bytes], *args) -> bytes:
+        lane = self.lanes[lane_name]
+        if lane.waiting >= lane.queue_size:
+            raise RenderQueueFull(lane_name)
+
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + lane.timeout
+        lane.waiting += 1
+        try:
+            await asyncio.wait_for(lane.acquire(), lane.timeout)
+        finally:
+            lane.waiting -= 1
+
+        executor = self.executor
+        try:
+            future = executor.submit(func, *args)
+        except BrokenProcessPool:
+            lane.release()
+            self._restart_executor(executor)
+            raise
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(lane.release))
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), deadline - loop.time())
+        except BrokenProcessPool:
+            self._restart_executor(executor)
+            raise
+
+
+render_pool = RenderPool()
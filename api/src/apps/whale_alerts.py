@@ -1,42 +1,69 @@
-import json
+import asyncio
 import logging
-from datetime import datetime, timedelta
+import time
+from functools import partial
+from typing import Optional, Set
 
-from src.handlers import send_multiple
-from .base import WebSocketConnector
+from src.broadcast import broadcaster
+from src.config import WhaleConfig
+from src.users import users_repo
+from .base import stream_manager
+from .latency import get_histogram
+from .whale_clusters import ClusterDetector
+from .whale_thresholds import threshold_index
 
-base_url = 'wss://fstream.binance.com/stream?streams=BTCUSDT@aggTrade'
 
-requested_tickers = {
-    'btcusdt': 100,
-    'ethusdt': 1500
-}
+class WhaleAlerts:
+    def __init__(self) -> None:
+        config = WhaleConfig()
+        self.detector = ClusterDetector(threshold_index.levels, config.window_list, config.cooldown)
+        self.delivery_latency = get_histogram('alerts processed→delivered')
+        self.symbols: Set[str] = set()
+        self.sync_task: Optional[asyncio.Future] = None
 
-connection_data = {
-    'method': 'SUBSCRIBE',
-    'params': [f'{ticker}@aggTrade' for ticker in requested_tickers],
-    'id': 1
-}
+    async def monitor_whale_trades(self) -> None:
+        for user in await users_repo.get_all_users():
+            threshold_index.update_user(user)
+        logging.info(f'Whale alert thresholds loaded for {len(threshold_index)} subscribers')
+        stream_manager.add_queue('trades', self.process, stream_manager.config.trade_policy)
+        threshold_index.listeners.append(self.schedule_sync)
+        broadcaster.unsubscribe_listeners.append(threshold_index.remove_user)
+        self.schedule_sync()
 
+    def schedule_sync(self) -> None:
+        if self.sync_task is None:
+            self.sync_task = asyncio.ensure_future(self.sync_symbols())
 
-class WhaleAlerts(WebSocketConnector):
-    def __init__(self) -> None:
-        super().__init__(connection_url=base_url, connection_data=connection_data)
+    async def sync_symbols(self) -> None:
+        try:
+            while (symbols := threshold_index.symbols) != self.symbols:
+                added, removed = symbols - self.symbols, self.symbols - symbols
+                self.symbols = symbols
+                await stream_manager.subscribe([f'{symbol.lower()}@aggTrade' for symbol in added], 'trades')
+                await stream_manager.unsubscribe([f'{symbol.lower()}@aggTrade' for symbol in removed])
+                logging.info(f'Whale alerts watch {len(symbols)} symbols: +{sorted(added)} -{sorted(removed)}')
+        finally:
+            self.sync_task = None
 
-    async def monitor_whale_trades(self) -> None:
-        await self.initialize_connection()
-        await self.subscribe()
-        start = datetime.now()
-        while True:
-            trade = json.loads(await self.receive_data())['data']
-            expected_amount = requested_tickers[trade['s'].lower()]
-            if float(trade['q']) >= expected_amount:
+    def process(self, stream: str, trade: dict) -> None:
+        quantity = float(trade['q'])
+        for level, window in self.detector.add(trade['s'], trade['T'], quantity, float(trade['p']), trade['m']):
+            if quantity >= level:
                 logging.info(f'Whale found. Sending signal')
-                await send_multiple(
+                message = (
                     f'Binance futures. {trade["s"]}\n'
                     f'{"🟥 Продажа" if trade["m"] else "🟩 Покупка"} {trade["q"]} по цене {trade["p"]}'
                 )
-                logging.info('Done')
-            if (now := datetime.now()) - timedelta(minutes=60) > start:
-                start = now
-                logging.info('Whale alerts works norminal')
+            else:
+                logging.info(f'Whale cluster found in {window.seconds:g} s window. Sending signal')
+                message = (
+                    f'Binance futures. {trade["s"]}\n'
+                    f'{"🟥 Продажи" if trade["m"] else "🟩 Покупки"} {window.quantity:.3f} за {window.seconds:g} сек '
+                    f'({len(window.trades)} сделок) по средней цене {window.price:.2f}'
+                )
+            processed_at = time.monotonic()
+            broadcaster.publish(
+                message,
+                on_sent=partial(self.delivery_latency.record_since, processed_at),
+                recipients=threshold_index.get_recipients(trade['s'], level)
+            )
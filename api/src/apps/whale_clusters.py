@@ -0,0 +1,86 @@
+from collections import deque
+from typing import Deque, Dict, List, Tuple
+
+Trade = Tuple[int, float, float]
+
+
+class RollingWindow:
+    """Quantity and notional traded on one side of a symbol during the last ``seconds``."""
+
+    __slots__ = ('seconds', 'length', 'factor', 'trades', 'quantity', 'notional', 'above')
+
+    def __init__(self, seconds: float, factor: float) -> None:
+        self.seconds = seconds
+        self.length = int(seconds * 1000)
+        self.factor = factor
+        self.trades: Deque[Trade] = deque()
+        self.quantity = 0.0
+        self.notional = 0.0
+        self.above: Dict[float, bool] = {}
+
+    def add(self, trade: Trade) -> None:
+        trades = self.trades
+        edge = trade[0] - self.length
+        if trades and trades[0][0] <= edge:
+            while trades and trades[0][0] <= edge:
+                _, quantity, notional = trades.popleft()
+                self.quantity -= quantity
+                self.notional -= notional
+            for level, above in self.above.items():
+                if above and self.quantity < level * self.factor:
+                    self.above[level] = False
+
+        trades.append(trade)
+        self.quantity += trade[1]
+        self.notional += trade[2]
+
+    def crossed(self, level: float) -> bool:
+        above = self.quantity >= level * self.factor
+        crossed = above and not self.above.get(level)
+        self.above[level] = above
+        return crossed
+
+    @property
+    def price(self) -> float:
+        return self.notional / self.quantity
+
+
+class ClusterDetector:
+    """Finds whales that split their orders into many trades."""
+
+    def __init__(self, levels: Dict[str, List[float]], windows: List[Tuple[float, float]], cooldown: float) -> None:
+        self.levels = levels
+        self.windows = windows
+        self.cooldown = int(cooldown * 1000)
+        self.sides: Dict[Tuple[str, bool], List[RollingWindow]] = {}
+        self.alerted_at: Dict[Tuple[str, bool, float], int] = {}
+
+    def add(
+            self,
+            symbol: str,
+            time: int,
+            quantity: float,
+            price: float,
+            is_sell: bool
+    ) -> List[Tuple[float, RollingWindow]]:
+        key = symbol, is_sell
+        if (windows := self.sides.get(key)) is None:
+            windows = self.sides[key] = [RollingWindow(seconds, factor) for seconds, factor in self.windows]
+
+        trade = time, quantity, quantity * price
+        for window in windows:
+            window.add(trade)
+
+        alerts = []
+        for level in self.levels.get(symbol, ()):
+            crossed = None
+            for window in windows:
+                if window.crossed(level) and crossed is None:
+                    crossed = window
+            if crossed is None:
+                continue
+            alert_key = symbol, is_sell, level
+            if time - self.alerted_at.get(alert_key, -self.cooldown) >= self.cooldown:
+                self.alerted_at[alert_key] = time
+                alerts.append((level, crossed))
+        return alerts
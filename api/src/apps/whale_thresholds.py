@@ -0,0 +1,84 @@
+import math
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+from typing import Any, Callable, Dict, List, Set, Tuple
+
+requested_tickers = {
+    'BTCUSDT': 100,
+    'ETHUSDT': 1500
+}
+
+THRESHOLD_OPTIONS = {
+    'BTCUSDT': (10, 50, 100, 250, 500, 1000),
+    'ETHUSDT': (150, 500, 1500, 5000, 15000),
+}
+
+
+def min_threshold(symbol: str) -> float:
+    return min(THRESHOLD_OPTIONS.get(symbol, (0,)))
+
+
+class ThresholdIndex:
+    """Subscribers of every symbol sorted by their whale alert threshold."""
+
+    def __init__(self) -> None:
+        self.entries: Dict[str, List[Tuple[float, int]]] = defaultdict(list)
+        self.users: Dict[int, Dict[str, float]] = {}
+        self.counts: Dict[str, Counter] = defaultdict(Counter)
+        self.levels: Dict[str, List[float]] = {}
+        self.listeners: List[Callable[[], None]] = []
+
+    def __len__(self) -> int:
+        return len(self.users)
+
+    @property
+    def symbols(self) -> Set[str]:
+        return {symbol for symbol, levels in self.levels.items() if levels}
+
+    def update_user(self, user: Dict[str, Any]) -> None:
+        user_id = int(user['id'])
+        thresholds = {}
+        if user.get('subscribe'):
+            thresholds = {
+                symbol: float(threshold)
+                for symbol, threshold in {**requested_tickers, **(user.get('thresholds') or {})}.items()
+                if threshold
+            }
+        self._set(user_id, thresholds)
+
+    def remove_user(self, user_id: int) -> None:
+        self._set(user_id, {})
+
+    def _set(self, user_id: int, thresholds: Dict[str, float]) -> None:
+        previous = self.users.pop(user_id, {})
+        if thresholds:
+            self.users[user_id] = thresholds
+        symbols_changed = False
+        for symbol in previous.keys() | thresholds.keys():
+            old, new = previous.get(symbol), thresholds.get(symbol)
+            if old == new:
+                continue
+            entries = self.entries[symbol]
+            counts = self.counts[symbol]
+            if old is not None:
+                del entries[bisect_left(entries, (old, user_id))]
+                counts[old] -= 1
+                if not counts[old]:
+                    del counts[old]
+            if new is not None:
+                insort(entries, (new, user_id))
+                counts[new] += 1
+            symbols_changed = symbols_changed or bool(self.levels.get(symbol)) != bool(counts)
+            self.levels[symbol] = sorted(counts)
+        if symbols_changed:
+            for listener in self.listeners:
+                listener()
+
+    def get_recipients(self, symbol: str, threshold: float) -> List[int]:
+        entries = self.entries.get(symbol, [])
+        start = bisect_left(entries, (threshold,))
+        end = bisect_left(entries, (threshold, math.inf), start)
+        return [user_id for _, user_id in entries[start:end]]
+
+
+threshold_index = ThresholdIndex()
@@ -0,0 +1,10 @@
+import asyncio
+
+from aiogram import Bot
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.dispatcher import Dispatcher
+
+from .config import TelegramConfig
+
+bot = Bot(TelegramConfig().bot_token.get_secret_value(), loop=asyncio.get_event_loop())
+dp = Dispatcher(bot, loop=bot.loop, storage=MemoryStorage())
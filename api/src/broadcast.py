@@ -0,0 +1,281 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from aiogram.types import ReplyKeyboardRemove
+from aiogram.utils.exceptions import (
+    BadRequest,
+    ChatNotFound,
+    NetworkError,
+    RestartingTelegram,
+    RetryAfter,
+    Unauthorized,
+)
+from aiohttp import ClientError
+
+from .bot import bot
+from .config import ApiConfig, BroadcastConfig
+from .users import Users, users_repo
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+class ChatCache:
+    """Chat types of the broadcast recipients."""
+
+    def __init__(self, users_repo: Users, ttl: float, bucket: TokenBucket) -> None:
+        self.users_repo = users_repo
+        self.ttl = ttl
+        self.bucket = bucket
+        self.chats: Dict[int, Tuple[str, float]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, users: Iterable[Dict[str, Any]]) -> None:
+        for user in users:
+            if user.get('chat_type') and user.get('chat_checked'):
+                checked = datetime.fromisoformat(user['chat_checked']).timestamp()
+                self.chats[int(user['id'])] = user['chat_type'], checked
+
+    async def get_type(self, chat_id: int) -> Optional[str]:
+        chat = self.chats.get(chat_id)
+        if chat and time.time() - chat[1] < self.ttl:
+            self.hits += 1
+            return chat[0]
+        self.misses += 1
+        await self.bucket.acquire()
+        try:
+            chat_type = (await bot.get_chat(chat_id)).type
+        except Exception as e:
+            logging.info(f'An error during get_chat operation: {e}')
+            return None
+        checked = datetime.now().replace(microsecond=0)
+        self.chats[chat_id] = chat_type, checked.timestamp()
+        self.users_repo.defer(chat_id, chat_type=chat_type, chat_checked=checked.isoformat())
+        return chat_type
+
+    def invalidate(self, chat_id: int) -> None:
+        self.chats.pop(chat_id, None)
+
+
+class Broadcast:
+    def __init__(
+            self,
+            number: int,
+            message: str,
+            check_admin: bool,
+            on_sent: Optional[Callable[[], None]],
+            recipients: Optional[List[int]]
+    ) -> None:
+        self.number = number
+        self.message = message
+        self.check_admin = check_admin
+        self.on_sent = on_sent
+        self.recipients = recipients
+        self.created_at = time.monotonic()
+        self.started_at = 0.0
+        self.pending: Optional[int] = None
+        self.delivered = 0
+        self.failed = 0
+        self.blocked: List[int] = []
+
+    def get_report(self) -> str:
+        return (
+            f'#{self.number}: {self.delivered} delivered, {self.failed} failed, {len(self.blocked)} blocked '
+            f'in {time.monotonic() - self.started_at:.1f} s'
+        )
+
+
+class Broadcaster:
+    """Delivers messages to subscribers in the background."""
+
+    def __init__(self) -> None:
+        self.config = BroadcastConfig()
+        self.bucket = TokenBucket(self.config.rate, self.config.burst)
+        self.broadcasts: asyncio.Queue = asyncio.Queue()
+        self.deliveries: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self.queued = 0
+        self.active: Deque[Broadcast] = deque()
+        self.reports: Deque[str] = deque(maxlen=5)
+        self.chat_next: Dict[int, float] = {}
+        self.chat_pruned_at = 0.0
+        self.unsubscribe_listeners: List[Callable[[int], None]] = []
+        self.users_repo = users_repo
+        self.chats = ChatCache(self.users_repo, self.config.chat_ttl, self.bucket)
+        self.published = 0
+        self.sent = 0
+        self.failed = 0
+
+    def publish(
+            self,
+            message: str,
+            check_admin=False,
+            on_sent: Optional[Callable[[], None]] = None,
+            recipients: Optional[List[int]] = None
+    ) -> None:
+        self.published += 1
+        broadcast = Broadcast(self.published, message, check_admin, on_sent, recipients)
+        self.active.append(broadcast)
+        self.broadcasts.put_nowait(broadcast)
+
+    def _release(self) -> None:
+        while self.active and self.active[0].pending == 0:
+            self.active.popleft()
+
+    async def run(self) -> None:
+        for _ in range(self.config.workers):
+            asyncio.ensure_future(self._deliver())
+        try:
+            self.chats.load(await self.users_repo.get_all_users())
+        except Exception as e:
+            logging.exception(f'Unable to load chat types: {e!r}')
+        while True:
+            broadcast = await self.broadcasts.get()
+            try:
+                recipients = await self._get_recipients(broadcast)
+            except Exception as e:
+                logging.exception(f'Unable to load broadcast recipients: {e!r}')
+                recipients = []
+            broadcast.started_at = time.monotonic()
+            broadcast.pending = len(recipients)
+            if not recipients:
+                await self._finish(broadcast)
+            priority = 0 if broadcast.recipients is not None else 1
+            for recipient in recipients:
+                self.queued += 1
+                self.deliveries.put_nowait((priority, self.queued, broadcast, recipient))
+
+    async def _get_recipients(self, broadcast: Broadcast) -> List[int]:
+        recipients = broadcast.recipients
+        if recipients is None:
+            recipients = await self.users_repo.get_recipients()
+        if broadcast.check_admin:
+            admins = {int(user['id']) for user in await self.users_repo.get_all_users() if user.get('admin')}
+            recipients = [recipient for recipient in recipients if recipient in admins]
+        return recipients
+
+    async def _deliver(self) -> None:
+        while True:
+            _, _, broadcast, recipient = await self.deliveries.get()
+            try:
+                delivered = await self._send(broadcast, recipient)
+            except Exception as e:
+                logging.exception(f'An error during send message to the user {recipient}: {e!r}')
+                delivered = False
+            if delivered:
+                broadcast.delivered += 1
+                self.sent += 1
+                if broadcast.on_sent:
+                    broadcast.on_sent()
+            else:
+                broadcast.failed += 1
+                self.failed += 1
+            broadcast.pending -= 1
+            if not broadcast.pending:
+                await self._finish(broadcast)
+
+    async def _wait_for_chat(self, chat_id: int) -> None:
+        interval = self.config.chat_interval if chat_id > 0 else self.config.group_interval
+        now = time.monotonic()
+        if now >= self.chat_pruned_at:
+            self.chat_next = {chat: next_at for chat, next_at in self.chat_next.items() if next_at > now}
+            self.chat_pruned_at = now + 60
+        next_at = self.chat_next.get(chat_id, 0.0)
+        self.chat_next[chat_id] = max(now, next_at) + interval
+        if next_at > now:
+            await asyncio.sleep(next_at - now)
+
+    async def _send(self, broadcast: Broadcast, recipient: int) -> bool:
+        attempt = 0
+        refreshed = False
+        while True:
+            chat_type = await self.chats.get_type(recipient)
+            kwargs = {'reply_markup': ReplyKeyboardRemove()} if chat_type not in (None, 'channel') else {}
+            await self._wait_for_chat(recipient)
+            await self.bucket.acquire()
+            try:
+                await bot.send_message(recipient, broadcast.message, parse_mode='html', **kwargs)
+            except RetryAfter as e:
+                logging.warning(f'Telegram asked to retry after {e.timeout} s')
+                self.bucket.pause(e.timeout)
+                continue
+            except (Unauthorized, ChatNotFound) as e:
+                logging.info(f'Recipient {recipient} is unavailable: {e}')
+                self.chats.invalidate(recipient)
+                broadcast.blocked.append(recipient)
+                return False
+            except BadRequest as e:
+                self.chats.invalidate(recipient)
+                if not refreshed:
+                    refreshed = True
+                    continue
+                logging.warning(f'An error during send message to the user {recipient}: {e!r}')
+                return False
+            except (NetworkError, RestartingTelegram, ClientError, asyncio.TimeoutError) as e:
+                if attempt < self.config.retries:
+                    attempt += 1
+                    await asyncio.sleep(2 ** attempt)
+                    continue
+                logging.warning(f'An error during send message to the user {recipient}: {e!r}')
+                return False
+            except Exception as e:
+                logging.warning(f'An error during send message to the user {recipient}: {e!r}')
+                return False
+            return True
+
+    async def _finish(self, broadcast: Broadcast) -> None:
+        report = broadcast.get_report()
+        self.reports.append(report)
+        logging.info(f'Broadcast {report}')
+        self._release()
+        if broadcast.blocked and ApiConfig().prod:
+            try:
+                await self.users_repo.unsubscribe_users(broadcast.blocked)
+            except Exception as e:
+                logging.exception(f'Unable to unsubscribe {len(broadcast.blocked)} users: {e!r}')
+            for user_id in broadcast.blocked:
+                for listener in self.unsubscribe_listeners:
+                    listener(user_id)
+
+    def get_backlog(self) -> Tuple[int, float]:
+        age = time.monotonic() - self.active[0].created_at if self.active else 0.0
+        return self.deliveries.qsize(), age
+
+    def get_stats(self) -> str:
+        deliveries, age = self.get_backlog()
+        return '\n'.join((
+            f'{self.broadcasts.qsize()} broadcasts and {deliveries} deliveries queued, oldest {age:.0f} s, '
+            f'{self.published} published, {self.sent} sent, {self.failed} failed',
+            f'Chat types: {len(self.chats.chats)} cached, {self.chats.hits} hits, {self.chats.misses} misses',
+            *self.reports
+        ))
+
+
+broadcaster = Broadcaster()
@@ -1,4 +1,5 @@
 from enum import Enum
+from typing import List, Tuple
 
 from pydantic import BaseSettings, Field, SecretStr
 
@@ -17,6 +18,12 @@ class AWSConfig(BaseSettings):
 class DynamoDBConfig(BaseSettings):
     port: str = Field(..., env='DYNAMODB_PORT')
     host: SecretStr = Field(..., env='DYNAMODB_HOST')
+    workers: int = Field(8, env='DYNAMODB_WORKERS')
+    batch_concurrency: int = Field(4, env='DYNAMODB_BATCH_CONCURRENCY')
+    batch_retries: int = Field(5, env='DYNAMODB_BATCH_RETRIES')
+    cache_size: int = Field(10000, env='USERS_CACHE_SIZE')
+    cache_ttl: float = Field(300, env='USERS_CACHE_TTL')
+    write_behind_interval: float = Field(60, env='USERS_WRITE_BEHIND_INTERVAL')
 
     @property
     def endpoint_url(self) -> str:
@@ -34,6 +41,11 @@ class TelegramConfig(BaseSettings):
         return f'{self.webhook_host}:{self.webhook_port}{self.webhook_url_path.get_secret_value()}'
 
 
+class UserStatsConfig(BaseSettings):
+    active_days: int = Field(7, env='USER_STATS_ACTIVE_DAYS')
+    reconcile_interval: float = Field(24 * 3600, env='USER_STATS_RECONCILE_INTERVAL')
+
+
 class ApiConfig(BaseSettings):
     mode: str = Field(..., env='MODE')
     host: str = Field(..., env='WEBAPP_HOST')
@@ -43,3 +55,90 @@ class ApiConfig(BaseSettings):
     @property
     def prod(self):
         return self.mode == APIMode.prod
+
+
+class WhaleConfig(BaseSettings):
+    windows: str = Field('1:1,10:2,60:5', env='WHALE_WINDOWS')
+    cooldown: float = Field(60, env='WHALE_COOLDOWN')
+
+    @property
+    def window_list(self) -> List[Tuple[float, float]]:
+        windows = []
+        for window in self.windows.split(','):
+            seconds, _, factor = window.partition(':')
+            windows.append((float(seconds), float(factor or 1)))
+        return windows
+
+
+class BroadcastConfig(BaseSettings):
+    workers: int = Field(16, env='BROADCAST_WORKERS')
+    rate: float = Field(28, env='BROADCAST_RATE')
+    burst: float = Field(28, env='BROADCAST_BURST')
+    chat_interval: float = Field(1, env='BROADCAST_CHAT_INTERVAL')
+    group_interval: float = Field(3, env='BROADCAST_GROUP_INTERVAL')
+    retries: int = Field(3, env='BROADCAST_RETRIES')
+    chat_ttl: float = Field(30 * 24 * 3600, env='BROADCAST_CHAT_TTL')
+
+
+class RenderConfig(BaseSettings):
+    workers: int = Field(2, env='RENDER_WORKERS')
+    queue_size: int = Field(10, env='RENDER_QUEUE_SIZE')
+    funding_concurrency: int = Field(1, env='RENDER_FUNDING_CONCURRENCY')
+    heatmap_concurrency: int = Field(1, env='RENDER_HEATMAP_CONCURRENCY')
+    orders_timeout: float = Field(10, env='RENDER_ORDERS_TIMEOUT')
+    funding_timeout: float = Field(60, env='RENDER_FUNDING_TIMEOUT')
+    heatmap_timeout: float = Field(30, env='RENDER_HEATMAP_TIMEOUT')
+
+
+class LadderRenderer(str, Enum):
+    matplotlib = 'matplotlib'
+    pillow = 'pillow'
+
+
+class OrderBookConfig(BaseSettings):
+    symbols: str = Field('BTCUSDT', env='ORDER_BOOK_SYMBOLS')
+    renderer: LadderRenderer = Field(LadderRenderer.matplotlib, env='ORDER_BOOK_RENDERER')
+    render_interval: float = Field(5, env='ORDER_BOOK_RENDER_INTERVAL')
+    render_check_interval: float = Field(1, env='ORDER_BOOK_RENDER_CHECK_INTERVAL')
+    change_threshold: float = Field(0.05, env='ORDER_BOOK_CHANGE_THRESHOLD')
+    idle_timeout: float = Field(60, env='ORDER_BOOK_IDLE_TIMEOUT')
+    resync_buffer_size: int = Field(2000, env='ORDER_BOOK_RESYNC_BUFFER_SIZE')
+    depth_stream: str = Field('depth', env='ORDER_BOOK_DEPTH_STREAM')
+    coalesce_interval: float = Field(0, env='ORDER_BOOK_COALESCE_INTERVAL')
+    snapshot_dir: str = Field('/data/order_books', env='ORDER_BOOK_SNAPSHOT_DIR')
+    snapshot_interval: float = Field(30, env='ORDER_BOOK_SNAPSHOT_INTERVAL')
+    snapshot_max_age: float = Field(600, env='ORDER_BOOK_SNAPSHOT_MAX_AGE')
+    history_interval: float = Field(10, env='ORDER_BOOK_HISTORY_INTERVAL')
+    history_size: int = Field(8640, env='ORDER_BOOK_HISTORY_SIZE')
+    history_rows: int = Field(100, env='ORDER_BOOK_HISTORY_ROWS')
+    history_symbols: str = Field('BTCUSDT', env='ORDER_BOOK_HISTORY_SYMBOLS')
+
+    @property
+    def symbol_list(self) -> List[str]:
+        return [symbol.strip().upper() for symbol in self.symbols.split(',') if symbol.strip()]
+
+    @property
+    def history_symbol_list(self) -> List[str]:
+        return [symbol.strip().upper() for symbol in self.history_symbols.split(',') if symbol.strip()]
+
+
+class QueuePolicy(str, Enum):
+    block = 'block'
+    drop_oldest = 'drop_oldest'
+    coalesce = 'coalesce'
+
+
+class StreamConfig(BaseSettings):
+    connect_timeout: float = Field(10, env='STREAM_CONNECT_TIMEOUT')
+    backoff_base: float = Field(1, env='STREAM_BACKOFF_BASE')
+    backoff_max: float = Field(60, env='STREAM_BACKOFF_MAX')
+    ping_interval: float = Field(20, env='STREAM_PING_INTERVAL')
+    ping_timeout: float = Field(10, env='STREAM_PING_TIMEOUT')
+    stale_timeout: float = Field(60, env='STREAM_STALE_TIMEOUT')
+    connection_lifetime: float = Field(23 * 3600, env='STREAM_CONNECTION_LIFETIME')
+    connection_streams: int = Field(200, env='STREAM_CONNECTION_STREAMS')
+    request_interval: float = Field(0.2, env='STREAM_REQUEST_INTERVAL')
+    queue_size: int = Field(5000, env='STREAM_QUEUE_SIZE')
+    depth_policy: QueuePolicy = Field(QueuePolicy.block, env='STREAM_DEPTH_POLICY')
+    ticker_policy: QueuePolicy = Field(QueuePolicy.coalesce, env='STREAM_TICKER_POLICY')
+    trade_policy: QueuePolicy = Field(QueuePolicy.block, env='STREAM_TRADE_POLICY')
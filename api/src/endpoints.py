@@ -1,7 +1,7 @@
 from aiohttp import web
 
 from .config import ApiConfig
-from .handlers import send_multiple
+from .broadcast import broadcaster
 
 routes = web.RouteTableDef()
 
@@ -14,6 +14,6 @@ async def index(request: web.Request):
 @routes.post(f'/{ApiConfig().notifications_path.get_secret_value()}')
 async def send_notifications(request: web.Request):
     data = await request.post()
-    await send_multiple(data['message'])
+    broadcaster.publish(data['message'])
 
     return web.Response(text='OK')
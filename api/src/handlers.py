@@ -1,13 +1,9 @@
-import asyncio
 import logging
 from contextlib import suppress
 from copy import deepcopy
-from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
 from functools import partial
 
-from aiogram import Bot
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
-from aiogram.dispatcher import Dispatcher
 from aiogram.types import (
     CallbackQuery,
     Message,
@@ -20,12 +16,21 @@ from aiogram.utils.exceptions import (
     MessageNotModified,
 )
 
+from .apps.base import stream_manager
 from .apps.funding import Funding
-from .apps.order_book import book
-from .config import ApiConfig
-from .config import TelegramConfig
-from .keyboards import block_size_keyboard, get_settings_keyboard
-from .users import Users
+from .apps.latency import histograms
+from .apps.order_book import manager, normalize_symbol, symbol_exists
+from .apps.whale_thresholds import THRESHOLD_OPTIONS, min_threshold, requested_tickers, threshold_index
+from .bot import bot, dp
+from .broadcast import broadcaster
+from .keyboards import (
+    block_size_keyboard,
+    get_settings_keyboard,
+    get_threshold_options_keyboard,
+    get_thresholds_keyboard,
+)
+from .user_stats import user_stats
+from .users import users_repo
 from .utils import (
     delete_incoming,
     log_incoming,
@@ -34,9 +39,6 @@ from .utils import (
     save_user,
 )
 
-bot = Bot(TelegramConfig().bot_token.get_secret_value(), loop=asyncio.get_event_loop())
-dp = Dispatcher(bot, loop=bot.loop, storage=MemoryStorage())
-
 
 @dp.message_handler(commands=['start'])
 @log_incoming
@@ -76,7 +78,11 @@ async def funding(msg: Message):
 @save_user
 @disable_for_group
 async def orders(msg: Message):
-    block_size = Users().get_user(msg.from_user.id).get('block_size') or 100
+    symbol = normalize_symbol(msg.get_args() or 'BTCUSDT')
+    if (book := manager.get(symbol)) is None:
+        await msg.answer(f'Стакан {symbol} не отслеживается', reply_markup=ReplyKeyboardRemove())
+        return
+    block_size = (await users_repo.get_user(msg.from_user.id)).get('block_size') or 100
     message = await book.draw(size=block_size)
     if isinstance(message, str):
         await msg.answer(message, reply_markup=ReplyKeyboardRemove())
@@ -84,41 +90,106 @@ async def orders(msg: Message):
         await bot.send_photo(msg.chat.id, message, reply_markup=ReplyKeyboardRemove())
 
 
+@dp.message_handler(commands=['heatmap'])
+@log_incoming
+@delete_incoming
+@save_user
+@disable_for_group
+async def heatmap(msg: Message):
+    args = msg.get_args().split()
+    symbol = normalize_symbol(args[0] if args else 'BTCUSDT')
+    try:
+        hours = min(float(args[1]), 24) if len(args) > 1 else 24
+    except ValueError:
+        hours = 24
+    if (book := manager.get(symbol)) is None:
+        await msg.answer(f'Стакан {symbol} не отслеживается', reply_markup=ReplyKeyboardRemove())
+        return
+    message = await book.draw_heatmap(hours)
+    if isinstance(message, str):
+        await msg.answer(message, reply_markup=ReplyKeyboardRemove())
+    else:
+        await bot.send_photo(msg.chat.id, message, reply_markup=ReplyKeyboardRemove())
+
+
+@dp.message_handler(commands=['whale'])
+@log_incoming
+@delete_incoming
+@save_user
+@disable_for_group
+async def whale(msg: Message):
+    user = await users_repo.get_user(msg.from_user.id)
+    thresholds = {**requested_tickers, **(user.get('thresholds') or {})}
+    args = msg.get_args().split()
+    if len(args) != 2:
+        current = '\n'.join(f'{symbol}: {threshold or "выкл"}' for symbol, threshold in sorted(thresholds.items()))
+        await msg.answer(
+            f'{current}\n\nИзменить порог: /whale BTC 250, отключить: /whale BTC off',
+            reply_markup=ReplyKeyboardRemove()
+        )
+        return
+
+    symbol = normalize_symbol(args[0])
+    minimum = min_threshold(symbol)
+    try:
+        if args[1].lower() == 'off':
+            threshold = Decimal(0)
+        elif 0 < (value := float(args[1])) < 1e12 and value >= minimum:
+            threshold = Decimal(int(value)) if value.is_integer() else Decimal(str(value))
+        else:
+            raise ValueError(args[1])
+    except (ValueError, InvalidOperation, OverflowError):
+        message = f'Неверный порог, минимум для {symbol}: {minimum}' if minimum else 'Неверный порог'
+        await msg.answer(message, reply_markup=ReplyKeyboardRemove())
+        return
+    if threshold and symbol not in thresholds and not await symbol_exists(symbol):
+        await msg.answer(f'Тикер {symbol} не найден', reply_markup=ReplyKeyboardRemove())
+        return
+
+    user['thresholds'] = {**(user.get('thresholds') or {}), symbol: threshold}
+    await users_repo.put_user(**user)
+    threshold_index.update_user(user)
+    message = f'Порог {symbol} = {threshold}' if threshold else f'Оповещения {symbol} отключены'
+    if not user.get('subscribe'):
+        message += '\nВы не подписаны на рассылку, включить ее можно в /settings'
+    await msg.answer(message, reply_markup=ReplyKeyboardRemove())
+
+
 @dp.message_handler(commands=['settings'])
 @log_incoming
 @delete_incoming
 @save_user
 @disable_for_group
 async def settings(msg: Message):
-    await msg.answer('Настройки', reply_markup=get_settings_keyboard(msg.from_user.id))
+    await msg.answer('Настройки', reply_markup=await get_settings_keyboard(msg.from_user.id))
 
 
 @dp.callback_query_handler(text='unsubscribe')
 @dp.callback_query_handler(text='subscribe')
 async def subscription(call: CallbackQuery):
-    users_repo = Users()
-    user = users_repo.get_user(call.from_user.id)
+    user = await users_repo.get_user(call.from_user.id)
     if call.data == 'subscribe':
         msg = 'Вы уже подписаны на рассылку'
         if not user.get('subscribe'):
             msg = 'Вы успешно подписались на рассылку'
             user['subscribe'] = True
-            users_repo.put_user(**user)
+            await users_repo.put_user(**user)
+            threshold_index.update_user(user)
     else:
         msg = 'Вы не подписаны на рассылку'
         if user.get('subscribe'):
             msg = 'Вы отписались от рассылки'
             user['subscribe'] = False
-            users_repo.put_user(**user)
+            await users_repo.put_user(**user)
+            threshold_index.update_user(user)
     with suppress(MessageNotModified):
-        await call.message.edit_text('Настройки', reply_markup=get_settings_keyboard(call.from_user.id))
+        await call.message.edit_text('Настройки', reply_markup=await get_settings_keyboard(call.from_user.id))
     await call.answer(msg, show_alert=True)
 
 
 @dp.callback_query_handler(text='block_size')
 async def block_size_settings(call: CallbackQuery):
-    users_repo = Users()
-    user = users_repo.get_user(call.from_user.id)
+    user = await users_repo.get_user(call.from_user.id)
 
     block_size = user.get('block_size') or 100
 
@@ -131,13 +202,12 @@ async def block_size_settings(call: CallbackQuery):
 
 @dp.callback_query_handler(lambda call: call.data.startswith('change_block_size'))
 async def change_block_size(call: CallbackQuery):
-    users_repo = Users()
-    user = users_repo.get_user(call.from_user.id)
+    user = await users_repo.get_user(call.from_user.id)
 
     block_size = int(call.data.split()[-1])
     user['block_size'] = block_size
 
-    users_repo.put_user(**user)
+    await users_repo.put_user(**user)
 
     text = f'Текущий размер блока = <b>{block_size}</b>'
 
@@ -146,56 +216,135 @@ async def change_block_size(call: CallbackQuery):
     await call.answer()
 
 
+@dp.callback_query_handler(text='thresholds')
+async def thresholds_settings(call: CallbackQuery):
+    user = await users_repo.get_user(call.from_user.id)
+
+    text = 'Минимальный размер сделки для оповещений о китах'
+
+    with suppress(MessageNotModified):
+        await call.message.edit_text(text, reply_markup=get_thresholds_keyboard(user))
+    await call.answer()
+
+
+@dp.callback_query_handler(lambda call: call.data.startswith('threshold '))
+async def threshold_settings(call: CallbackQuery):
+    user = await users_repo.get_user(call.from_user.id)
+
+    symbol = call.data.split()[-1]
+    threshold = (user.get('thresholds') or {}).get(symbol, requested_tickers[symbol])
+
+    text = f'Текущий порог {symbol} = <b>{threshold}</b>'
+
+    with suppress(MessageNotModified):
+        await call.message.edit_text(text, parse_mode='html', reply_markup=get_threshold_options_keyboard(symbol))
+    await call.answer()
+
+
+@dp.callback_query_handler(lambda call: call.data.startswith('change_threshold'))
+async def change_threshold(call: CallbackQuery):
+    user = await users_repo.get_user(call.from_user.id)
+
+    _, symbol, threshold = call.data.split()
+    threshold = int(threshold)
+    if threshold not in THRESHOLD_OPTIONS.get(symbol, ()):
+        await call.answer()
+        return
+    user['thresholds'] = {**(user.get('thresholds') or {}), symbol: threshold}
+
+    await users_repo.put_user(**user)
+    threshold_index.update_user(user)
+
+    text = f'Текущий порог {symbol} = <b>{threshold}</b>'
+
+    with suppress(MessageNotModified):
+        await call.message.edit_text(text, parse_mode='html', reply_markup=get_threshold_options_keyboard(symbol))
+    await call.answer()
+
+
 @dp.callback_query_handler(text='settings')
 async def return_to_settings(call: CallbackQuery):
     with suppress(MessageNotModified):
-        await call.message.edit_text('Настройки', reply_markup=get_settings_keyboard(call.from_user.id))
+        await call.message.edit_text('Настройки', reply_markup=await get_settings_keyboard(call.from_user.id))
     await call.answer()
 
 
 @dp.message_handler(commands=['system'])
 @log_incoming
 async def system_monitor(msg: Message):
-    if await Users().is_admin(msg.from_user.id):
+    if await users_repo.is_admin(msg.from_user.id):
         await msg.answer(get_system_usage(), reply_markup=ReplyKeyboardRemove())
 
 
+@dp.message_handler(commands=['track'])
+@log_incoming
+async def track_symbol(msg: Message):
+    if await users_repo.is_admin(msg.from_user.id):
+        if not msg.get_args().strip():
+            await msg.answer('Укажите тикер: /track BTC', reply_markup=ReplyKeyboardRemove())
+            return
+        symbol = normalize_symbol(msg.get_args().strip())
+        try:
+            await manager.add_symbol(symbol)
+            message = f'Стакан {symbol} добавлен'
+        except ValueError as e:
+            message = str(e)
+        await msg.answer(message, reply_markup=ReplyKeyboardRemove())
+
+
+@dp.message_handler(commands=['untrack'])
+@log_incoming
+async def untrack_symbol(msg: Message):
+    if await users_repo.is_admin(msg.from_user.id):
+        if not msg.get_args().strip():
+            await msg.answer('Укажите тикер: /untrack BTC', reply_markup=ReplyKeyboardRemove())
+            return
+        symbol = normalize_symbol(msg.get_args().strip())
+        if await manager.remove_symbol(symbol):
+            message = f'Стакан {symbol} удален'
+        else:
+            message = f'Стакан {symbol} не отслеживается'
+        await msg.answer(message, reply_markup=ReplyKeyboardRemove())
+
+
+@dp.message_handler(commands=['books'])
+@log_incoming
+async def order_books(msg: Message):
+    if await users_repo.is_admin(msg.from_user.id):
+        stats = [book.get_stats() for book in manager.books.values()]
+        await msg.answer('\n'.join(stats) or 'Нет отслеживаемых стаканов', reply_markup=ReplyKeyboardRemove())
+
+
+@dp.message_handler(commands=['streams'])
+@log_incoming
+async def streams(msg: Message):
+    if await users_repo.is_admin(msg.from_user.id):
+        await msg.answer(stream_manager.get_stats(), reply_markup=ReplyKeyboardRemove())
+
+
+@dp.message_handler(commands=['latency'])
+@log_incoming
+async def latency(msg: Message):
+    if await users_repo.is_admin(msg.from_user.id):
+        stats = [histogram.get_stats() for histogram in histograms.values()]
+        if msg.get_args() == 'reset':
+            for histogram in histograms.values():
+                histogram.reset()
+        await msg.answer('\n'.join(stats) or 'Нет данных', reply_markup=ReplyKeyboardRemove())
+
+
+@dp.message_handler(commands=['broadcasts'])
+@log_incoming
+async def broadcasts(msg: Message):
+    if await users_repo.is_admin(msg.from_user.id):
+        await msg.answer(broadcaster.get_stats(), reply_markup=ReplyKeyboardRemove())
+
+
 @dp.message_handler(commands=['users'])
 @log_incoming
 async def all_users(msg: Message):
-    if await Users().is_admin(msg.from_user.id):
-        users = Users().get_all_users()
-        active_users = [
-            user for user in users
-            if 'last_seen' in user and datetime.fromisoformat(user['last_seen']) > datetime.now() - timedelta(days=7)
-        ]
+    if await users_repo.is_admin(msg.from_user.id):
         await msg.answer(
-            '\n'.join((
-                f'Count: {len(users)}',
-                f'Subscribed: {len([user for user in users if user.get("subscribe")])}',
-                f'Active: {len(active_users)}'
-            )),
+            '\n'.join((user_stats.get_stats(), users_repo.get_stats())),
             reply_markup=ReplyKeyboardRemove()
         )
-
-
-async def send_multiple(message: str, check_admin=False) -> None:
-    users_repo = Users()
-    for recipient in users_repo.get_recipients():
-        try:
-            kwargs = {}
-            try:
-                chat = await bot.get_chat(recipient)
-                if not chat.type == 'channel':
-                    kwargs = {'reply_markup': ReplyKeyboardRemove()}
-            except Exception as e:
-                logging.info(f'An error during get_chat operation: {e}')
-            if not check_admin or (check_admin and await users_repo.is_admin(recipient)):
-                logging.info(f'Sending alert to {recipient}')
-                await bot.send_message(recipient, message, parse_mode='html', **kwargs)
-        except Exception as e:
-            logging.warning(f'An error during send message to the user {recipient}: {e}')
-            if ApiConfig().prod:
-                user = users_repo.get_user(recipient)
-                user['subscribe'] = False
-                users_repo.put_user(**user)
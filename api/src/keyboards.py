@@ -3,7 +3,8 @@ from aiogram.types import (
     InlineKeyboardButton,
 )
 
-from .users import Users
+from .apps.whale_thresholds import THRESHOLD_OPTIONS, requested_tickers
+from .users import users_repo
 
 block_size_keyboard = InlineKeyboardMarkup(row_width=1).add(
     InlineKeyboardButton(text='100', callback_data='change_block_size 100'),
@@ -13,8 +14,8 @@ block_size_keyboard = InlineKeyboardMarkup(row_width=1).add(
 )
 
 
-def get_settings_keyboard(user_id: int):
-    user = Users().get_user(user_id)
+async def get_settings_keyboard(user_id: int):
+    user = await users_repo.get_user(user_id)
     if user.get('subscribe'):
         text = 'Отписаться от рассылки'
         callback_data = 'unsubscribe'
@@ -24,5 +25,30 @@ def get_settings_keyboard(user_id: int):
 
     return InlineKeyboardMarkup(row_width=1).add(
         InlineKeyboardButton(text=text, callback_data=callback_data),
-        InlineKeyboardButton(text='Размер блоков стакана', callback_data='block_size')
+        InlineKeyboardButton(text='Размер блоков стакана', callback_data='block_size'),
+        InlineKeyboardButton(text='Пороги оповещений о китах', callback_data='thresholds')
+    )
+
+
+def get_thresholds_keyboard(user: dict):
+    thresholds = user.get('thresholds') or {}
+    return InlineKeyboardMarkup(row_width=1).add(
+        *(
+            InlineKeyboardButton(
+                text=f'{symbol}: {thresholds.get(symbol, default)}',
+                callback_data=f'threshold {symbol}'
+            )
+            for symbol, default in requested_tickers.items()
+        ),
+        InlineKeyboardButton(text='Назад', callback_data='settings')
+    )
+
+
+def get_threshold_options_keyboard(symbol: str):
+    return InlineKeyboardMarkup(row_width=1).add(
+        *(
+            InlineKeyboardButton(text=str(option), callback_data=f'change_threshold {symbol} {option}')
+            for option in THRESHOLD_OPTIONS[symbol]
+        ),
+        InlineKeyboardButton(text='Назад', callback_data='thresholds')
     )
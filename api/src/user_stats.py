@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import math
+import time
+from datetime import date, datetime, timedelta
+from hashlib import blake2b
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from .config import UserStatsConfig
+from .users import users_repo
+
+HLL_PRECISION = 14
+
+
+class HyperLogLog:
+    """Approximate count of distinct user ids."""
+
+    def __init__(self) -> None:
+        self.size = 1 << HLL_PRECISION
+        self.registers = bytearray(self.size)
+
+    def add(self, user_id: int) -> None:
+        value = int.from_bytes(blake2b(str(user_id).encode(), digest_size=8).digest(), 'big')
+        index = value >> (64 - HLL_PRECISION)
+        rank = 64 - HLL_PRECISION - (value & ((1 << (64 - HLL_PRECISION)) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, other: 'HyperLogLog') -> None:
+        registers = np.maximum(np.frombuffer(self.registers, np.uint8), np.frombuffer(other.registers, np.uint8))
+        self.registers = bytearray(registers.tobytes())
+
+    def __len__(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        estimate = alpha * self.size ** 2 / np.ldexp(1.0, -np.frombuffer(self.registers, np.uint8).astype(int)).sum()
+        if estimate <= 2.5 * self.size and (zeros := self.registers.count(0)):
+            estimate = self.size * math.log(self.size / zeros)
+        return round(estimate)
+
+
+class UserStats:
+    """Counters behind /users."""
+
+    def __init__(self) -> None:
+        self.config = UserStatsConfig()
+        self.total: Optional[int] = None
+        self.days: Dict[date, HyperLogLog] = {}
+        self.reconciled_at: Optional[datetime] = None
+        users_repo.delete_listeners.append(self.remove_users)
+
+    def add_user(self, user_id: int) -> None:
+        if self.total is not None:
+            self.total += 1
+        self.seen(user_id, datetime.now())
+
+    def remove_users(self, user_ids: List[int]) -> None:
+        if self.total is not None:
+            self.total -= len(user_ids)
+
+    def seen(self, user_id: int, when: datetime) -> None:
+        day = when.date()
+        if day <= date.today() - timedelta(days=self.config.active_days):
+            return
+        if (days := self.days.get(day)) is None:
+            days = self.days[day] = HyperLogLog()
+            self._prune()
+        days.add(user_id)
+
+    def _prune(self) -> None:
+        oldest = date.today() - timedelta(days=self.config.active_days)
+        for day in [day for day in self.days if day <= oldest]:
+            del self.days[day]
+
+    def get_active(self) -> int:
+        self._prune()
+        active = HyperLogLog()
+        for day in self.days.values():
+            active.update(day)
+        return len(active)
+
+    def reconcile(self, users: Iterable[dict]) -> None:
+        total = 0
+        for user in users:
+            total += 1
+            if 'last_seen' in user:
+                self.seen(int(user['id']), datetime.fromisoformat(user['last_seen']))
+        self.total = total
+        self.reconciled_at = datetime.now().replace(microsecond=0)
+
+    async def reconcile_daily(self) -> None:
+        while True:
+            started = time.monotonic()
+            try:
+                users = await users_repo.get_all_users()
+                self.reconcile(users)
+                logging.info(f'User stats reconciled in {time.monotonic() - started:.1f} s: {self.get_stats()}')
+            except Exception as e:
+                logging.exception(f'Unable to reconcile user stats: {e!r}')
+            await asyncio.sleep(self.config.reconcile_interval)
+
+    def get_stats(self) -> str:
+        if self.total is None:
+            return 'User stats are not loaded yet'
+        subscribed = len(users_repo.recipients) if users_repo.recipients is not None else '-'
+        return '\n'.join((
+            f'Count: {self.total}',
+            f'Subscribed: {subscribed}',
+            f'Active: ~{self.get_active()}',
+            f'Reconciled at {self.reconciled_at.isoformat()}',
+        ))
+
+
+user_stats = UserStats()
@@ -1,45 +1,326 @@
-from typing import Any, Dict, List, Optional
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 
 import boto3
 from boto3.dynamodb.conditions import Key
+from botocore.exceptions import BotoCoreError, ClientError
 
 from src.config import AWSConfig, DynamoDBConfig
 
+SUBSCRIBERS_INDEX = 'Subscribers'
+
+
+def index_subscription(user: Dict[str, Any]) -> Dict[str, Any]:
+    user = {key: value for key, value in user.items() if key != 'subscribed'}
+    if user.get('subscribe'):
+        user['subscribed'] = 1
+    return user
+
 
 class Users:
+    """The Users table behind an in-process write-through cache."""
+
     def __init__(self) -> None:
-        self.resource = boto3.resource(
+        config = DynamoDBConfig()
+        self.endpoint_url = config.endpoint_url
+        self.executor = ThreadPoolExecutor(config.workers, thread_name_prefix='dynamodb')
+        self.local = threading.local()
+        self.batch_concurrency = config.batch_concurrency
+        self.batch_retries = config.batch_retries
+        self.cache_size = config.cache_size
+        self.cache_ttl = config.cache_ttl
+        self.write_behind_interval = config.write_behind_interval
+        self.pending: Dict[int, Dict[str, Any]] = {}
+        self.recipients: Optional[Set[int]] = None
+        self.changes: List[Dict[int, Optional[Dict[str, Any]]]] = []
+        self.scan: Optional[asyncio.Future] = None
+        self.delete_listeners: List[Callable[[List[int]], None]] = []
+        self.cache: 'OrderedDict[int, Tuple[float, Optional[Dict[str, Any]]]]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _create_resource(self):
+        return boto3.session.Session().resource(
             'dynamodb',
             region_name=AWSConfig().region,
-            endpoint_url=DynamoDBConfig().endpoint_url,
+            endpoint_url=self.endpoint_url,
             aws_access_key_id=AWSConfig().access_key.get_secret_value(),
             aws_secret_access_key=AWSConfig().secret_access_key.get_secret_value()
         )
 
-    def get_recipients(self) -> List[int]:
-        recipients = self.resource.Table('Users').scan(
-            FilterExpression=Key('subscribe').eq(True),
-            ProjectionExpression='id'
-        )['Items']
-        return [int(recipient['id']) for recipient in recipients]
+    @property
+    def resource(self):
+        if (resource := getattr(self.local, 'resource', None)) is None:
+            resource = self.local.resource = self._create_resource()
+        return resource
+
+    @property
+    def table(self):
+        return self.resource.Table('Users')
+
+    async def _run(self, func: Callable, *args, **kwargs) -> Any:
+        return await asyncio.get_event_loop().run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+    async def _read(self, func: Callable, *args) -> Tuple[Any, Dict[int, Optional[Dict[str, Any]]]]:
+        changes = {}
+        self.changes.append(changes)
+        try:
+            return await self._run(func, *args), changes
+        finally:
+            self.changes = [other for other in self.changes if other is not changes]
 
-    def get_all_users(self) -> List[Dict[str, Any]]:
-        return self.resource.Table('Users').scan()['Items']
+    def _cache(self, user_id: int, user: Optional[Dict[str, Any]]) -> None:
+        self.cache[user_id] = time.monotonic() + self.cache_ttl, deepcopy(user)
+        self.cache.move_to_end(user_id)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
 
-    def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
-        user = self.resource.Table('Users').query(
+    def _paginate(self, method: str, **kwargs) -> List[Dict[str, Any]]:
+        request = getattr(self.table, method)
+        items = []
+        while True:
+            response = request(**kwargs)
+            items.extend(response['Items'])
+            if 'LastEvaluatedKey' not in response:
+                return items
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def _query_subscribers(self) -> List[Dict[str, Any]]:
+        try:
+            return self._paginate(
+                'query',
+                IndexName=SUBSCRIBERS_INDEX,
+                KeyConditionExpression=Key('subscribed').eq(1),
+                ProjectionExpression='id'
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ValidationException':
+                raise
+            logging.warning(f'No {SUBSCRIBERS_INDEX} index on the Users table, scanning it: {e!r}')
+        return self._paginate('scan', FilterExpression=Key('subscribe').eq(True), ProjectionExpression='id')
+
+    def _query_user(self, user_id: int) -> Optional[Dict[str, Any]]:
+        user = self.table.query(
             KeyConditionExpression=Key('id').eq(user_id)
         )['Items']
         return user[0] if user else None
 
-    def put_user(self, **kwargs) -> None:
-        self.resource.Table('Users').put_item(Item=kwargs)
+    def _put(self, item: Dict[str, Any]) -> None:
+        self.table.put_item(Item=item)
+
+    def _update_pending(self, pending: Dict[int, Dict[str, Any]]) -> List[int]:
+        table = self.table
+        saved = []
+        for user_id, attributes in pending.items():
+            try:
+                table.update_item(
+                    Key={'id': user_id},
+                    UpdateExpression='SET ' + ', '.join(f'{name} = :{name}' for name in attributes),
+                    ConditionExpression='attribute_exists(id)',
+                    ExpressionAttributeValues={f':{name}': value for name, value in attributes.items()}
+                )
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    logging.warning(f'Unable to save {len(pending) - len(saved)} pending user updates: {e!r}')
+                    break
+            except BotoCoreError as e:
+                logging.warning(f'Unable to save {len(pending) - len(saved)} pending user updates: {e!r}')
+                break
+            saved.append(user_id)
+        return saved
+
+    def _batch_get(self, keys: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        response = self.resource.batch_get_item(RequestItems={'Users': {'Keys': keys}})
+        unprocessed = response.get('UnprocessedKeys', {}).get('Users', {}).get('Keys', [])
+        return response['Responses'].get('Users', []), unprocessed
+
+    def _batch_write(self, requests: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        response = self.resource.batch_write_item(RequestItems={'Users': requests})
+        return [], response.get('UnprocessedItems', {}).get('Users', [])
+
+    async def _batch_chunk(
+            self,
+            action: str,
+            func: Callable,
+            requests: List[Dict[str, Any]],
+            semaphore: asyncio.Semaphore
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        items = []
+        async with semaphore:
+            for attempt in range(self.batch_retries + 1):
+                if attempt:
+                    await asyncio.sleep(random.uniform(0, 0.1 * 2 ** attempt))
+                try:
+                    processed, requests = await self._run(func, requests)
+                    items.extend(processed)
+                except ClientError as e:
+                    if e.response['Error']['Code'] != 'ProvisionedThroughputExceededException':
+                        logging.warning(f'Unable to {action} {len(requests)} users: {e!r}')
+                        return items, requests
+                except BotoCoreError as e:
+                    logging.warning(f'Unable to {action} {len(requests)} users: {e!r}')
+                    return items, requests
+                if not requests:
+                    return items, []
+            return items, requests
+
+    async def _batch(
+            self,
+            action: str,
+            func: Callable,
+            requests: List[Dict[str, Any]],
+            size: int
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        semaphore = asyncio.Semaphore(self.batch_concurrency)
+        chunks = await asyncio.gather(*(
+            self._batch_chunk(action, func, requests[start:start + size], semaphore)
+            for start in range(0, len(requests), size)
+        ))
+        return [item for items, _ in chunks for item in items], [request for _, failed in chunks for request in failed]
+
+    async def batch_get(self, user_ids: List[int]) -> List[Dict[str, Any]]:
+        users, failed = await self._batch('read', self._batch_get, [{'id': user_id} for user_id in user_ids], 100)
+        if failed:
+            logging.warning(f'Unable to read {len(failed)} users')
+        return users
 
-    async def delete_users(self, user_ids: List[int]) -> None:
-        table = self.resource.Table('Users')
+    async def batch_write(self, requests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return (await self._batch('write', self._batch_write, requests, 25))[1]
+
+    def _saved(self, user_id: int, user: Optional[Dict[str, Any]]) -> None:
+        if user is None:
+            self.cache.pop(user_id, None)
+        else:
+            self._cache(user_id, user)
+        for changes in self.changes:
+            changes[user_id] = deepcopy(user)
+        if self.recipients is not None:
+            self._set_subscribed(self.recipients, user_id, user)
+
+    @staticmethod
+    def _set_subscribed(recipients: Set[int], user_id: int, user: Optional[Dict[str, Any]]) -> None:
+        if user and user.get('subscribe'):
+            recipients.add(user_id)
+        else:
+            recipients.discard(user_id)
+
+    def _load_recipients(self, recipients: Set[int], changes: Dict[int, Optional[Dict[str, Any]]]) -> None:
+        for user_id, user in changes.items():
+            self._set_subscribed(recipients, user_id, user)
+        self.recipients = recipients
+
+    async def get_recipients(self) -> List[int]:
+        if self.recipients is None:
+            recipients, changes = await self._read(self._query_subscribers)
+            if self.recipients is None:
+                self._load_recipients({int(recipient['id']) for recipient in recipients}, changes)
+                logging.info(f'Loaded {len(self.recipients)} subscribers')
+        return list(self.recipients)
+
+    async def _scan_users(self) -> List[Dict[str, Any]]:
+        items, changes = await self._read(self._paginate, 'scan')
+        users = {int(user['id']): user for user in items}
+        for user_id, user in users.items():
+            if user_id in self.cache and user_id not in changes:
+                self._cache(user_id, user)
+        self._load_recipients({user_id for user_id, user in users.items() if user.get('subscribe')}, changes)
+        users.update(changes)
+        return [user for user in users.values() if user is not None]
+
+    async def get_all_users(self) -> List[Dict[str, Any]]:
+        if self.scan is None:
+            self.scan = asyncio.ensure_future(self._scan_users())
+            self.scan.add_done_callback(lambda _: setattr(self, 'scan', None))
+        return await asyncio.shield(self.scan)
+
+    async def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
+        cached = self.cache.get(user_id)
+        if cached and cached[0] > time.monotonic():
+            self.hits += 1
+            self.cache.move_to_end(user_id)
+            return deepcopy(cached[1])
+        self.misses += 1
+        user, changes = await self._read(self._query_user, user_id)
+        if user_id in changes:
+            return deepcopy(changes[user_id])
+        self._cache(user_id, user)
+        return user
+
+    async def put_user(self, **kwargs) -> None:
+        user = index_subscription(kwargs)
+        await self._run(self._put, user)
+        self._saved(int(user['id']), user)
+
+    def defer(self, user_id: int, **attributes) -> None:
+        self.pending.setdefault(user_id, {}).update(attributes)
+        if (cached := self.cache.get(user_id)) and cached[1] is not None:
+            cached[1].update(attributes)
+
+    async def flush_pending(self) -> None:
+        pending, self.pending = self.pending, {}
+        if not pending:
+            return
+        saved = []
+        try:
+            saved = await self._run(self._update_pending, pending)
+        finally:
+            for user_id in saved:
+                del pending[user_id]
+            for user_id, attributes in self.pending.items():
+                pending[user_id] = {**pending.get(user_id, {}), **attributes}
+            self.pending = pending
+
+    async def save_pending(self) -> None:
+        while True:
+            await asyncio.sleep(self.write_behind_interval)
+            try:
+                await self.flush_pending()
+            except Exception as e:
+                logging.exception(f'Unable to save pending user updates: {e!r}')
+
+    async def unsubscribe_users(self, user_ids: List[int]) -> None:
+        users = await self.batch_get(list(dict.fromkeys(user_ids)))
+        users = [index_subscription({**user, 'subscribe': False}) for user in users]
+        failed = await self.batch_write([{'PutRequest': {'Item': user}} for user in users])
+        failed_ids = {int(request['PutRequest']['Item']['id']) for request in failed}
+        for user in users:
+            if int(user['id']) not in failed_ids:
+                self._saved(int(user['id']), user)
+        logging.info(f'Unsubscribed {len(users) - len(failed)} users, {len(failed)} failed')
+
+    async def delete_users(self, user_ids: List[int]) -> Tuple[int, int]:
+        user_ids = list(dict.fromkeys(user_ids))
+        failed = await self.batch_write([{'DeleteRequest': {'Key': {'id': user_id}}} for user_id in user_ids])
+        failed_ids = {int(request['DeleteRequest']['Key']['id']) for request in failed}
+        deleted = [user_id for user_id in user_ids if user_id not in failed_ids]
         for user_id in user_ids:
-            table.delete_item(Key={'id': user_id})
+            if user_id in failed_ids:
+                self.cache.pop(user_id, None)
+            else:
+                self._saved(user_id, None)
+        for listener in self.delete_listeners:
+            listener(deleted)
+        logging.info(f'Deleted {len(user_ids) - len(failed)} users, {len(failed)} failed')
+        return len(user_ids) - len(failed), len(failed)
 
     async def is_admin(self, user_id: int) -> bool:
-        user = self.get_user(user_id) or {}
+        user = await self.get_user(user_id) or {}
         return user.get('admin')
+
+    def get_stats(self) -> str:
+        return (
+            f'Users cache: {len(self.cache)}/{self.cache_size} cached, {self.hits} hits, {self.misses} misses, '
+            f'{len(self.pending)} updates pending, '
+            f'{len(self.recipients) if self.recipients is not None else "-"} subscribers loaded'
+        )
+
+
+users_repo = Users()
@@ -14,7 +14,8 @@ from aiogram.utils.exceptions import (
     BotKicked,
 )
 
-from .users import Users
+from .user_stats import user_stats
+from .users import users_repo
 
 
 def cached(seconds=5, only_kwargs=False):
@@ -91,11 +92,11 @@ def disable_for_group(func: Callable):
 
 def save_user(func: Callable):
     async def wrapper(message: Message, **_):
-        users_repo = Users()
-        user = users_repo.get_user(message.from_user.id)
-        last_seen = datetime.now().replace(microsecond=0).isoformat()
+        user = await users_repo.get_user(message.from_user.id)
+        now = datetime.now().replace(microsecond=0)
+        last_seen = now.isoformat()
         if not user:
-            users_repo.put_user(
+            await users_repo.put_user(
                 id=message.from_user.id,
                 last_seen=last_seen,
                 name=' '.join((
@@ -104,8 +105,10 @@ def save_user(func: Callable):
                     message.from_user.username or ''
                 ))
             )
+            user_stats.add_user(message.from_user.id)
         else:
-            users_repo.put_user(**{**user, 'last_seen': last_seen})
+            users_repo.defer(message.from_user.id, last_seen=last_seen)
+            user_stats.seen(message.from_user.id, now)
 
         return await func(message)
 
@@ -2,6 +2,7 @@ import asyncio
 import logging
 
 import boto3
+from boto3.dynamodb.conditions import Attr
 
 from .config import AWSConfig, DynamoDBConfig
 from .main import start_monitoring
@@ -11,6 +12,28 @@ logging.basicConfig(
     level=logging.INFO
 )
 
+SUBSCRIBED_ATTRIBUTE = {
+    'AttributeName': 'subscribed',
+    'AttributeType': 'N'
+}
+
+SUBSCRIBERS_INDEX = {
+    'IndexName': 'Subscribers',
+    'KeySchema': [
+        {
+            'AttributeName': 'subscribed',
+            'KeyType': 'HASH'
+        }
+    ],
+    'Projection': {
+        'ProjectionType': 'KEYS_ONLY'
+    },
+    'ProvisionedThroughput': {
+        'ReadCapacityUnits': 1,
+        'WriteCapacityUnits': 1,
+    }
+}
+
 
 def create_schema(client):
     client.create_table(
@@ -53,8 +76,10 @@ def create_schema(client):
             {
                 'AttributeName': 'id',
                 'AttributeType': 'N'
-            }
+            },
+            SUBSCRIBED_ATTRIBUTE
         ],
+        GlobalSecondaryIndexes=[SUBSCRIBERS_INDEX],
         ProvisionedThroughput={
             'ReadCapacityUnits': 1,
             'WriteCapacityUnits': 1,
@@ -62,6 +87,32 @@ def create_schema(client):
     )
 
 
+def migrate_schema(client, resource):
+    indexes = client.describe_table(TableName='Users')['Table'].get('GlobalSecondaryIndexes', [])
+    if any(index['IndexName'] == SUBSCRIBERS_INDEX['IndexName'] for index in indexes):
+        return
+    logging.info('Creating the index of subscribers.')
+    client.update_table(
+        TableName='Users',
+        AttributeDefinitions=[SUBSCRIBED_ATTRIBUTE],
+        GlobalSecondaryIndexUpdates=[{'Create': SUBSCRIBERS_INDEX}]
+    )
+    table = resource.Table('Users')
+    kwargs = {'FilterExpression': Attr('subscribe').eq(True), 'ProjectionExpression': 'id'}
+    while True:
+        response = table.scan(**kwargs)
+        for user in response['Items']:
+            table.update_item(
+                Key={'id': user['id']},
+                UpdateExpression='SET subscribed = :subscribed',
+                ExpressionAttributeValues={':subscribed': 1}
+            )
+        if 'LastEvaluatedKey' not in response:
+            break
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    logging.info('Creation of the index of subscribers complete.')
+
+
 async def main():
     kwargs = {
         'region_name': AWSConfig().region,
@@ -75,6 +126,8 @@ async def main():
         logging.info('Creating tables.')
         create_schema(client)
         logging.info('Creation of tables complete.')
+    else:
+        migrate_schema(client, resource)
 
     await start_monitoring(resource)
 